@@ -0,0 +1,199 @@
+import pandas as pd
+import os
+import re
+import time
+import sqlite3
+import argparse
+
+# File with the data warehouse DDL
+ddl_path = "Task_4_DDL.txt"
+
+# Directory containing the Task 6 data marts
+marts_dir = "Data_Marts"
+
+# Schemas of the data warehouse. SQLite has no schemas, so schema.Table becomes schema_Table.
+schemas = ['master', 'transaction', 'staging']
+
+# Set-based merges from the staging tables into the master and transaction tables, in dependency order.
+# Dimension marts can hold several rows per key (e.g. a postal code in two cities), so the first staged row of
+# each key is kept; dimensions are upserted so IDs from the key registry update in place across loads.
+merge_statements = {
+    "master.Segments": """
+        INSERT INTO master_Segments (SegmentID, SegmentName)
+        SELECT SegmentID, SegmentName FROM staging_Segment_Dimension
+        WHERE rowid IN (SELECT MIN(rowid) FROM staging_Segment_Dimension GROUP BY SegmentID)
+        ON CONFLICT (SegmentID) DO UPDATE SET SegmentName = excluded.SegmentName
+    """,
+    "master.Customers": """
+        INSERT INTO master_Customers (CustomerID, CustomerName, SegmentID)
+        SELECT CustomerID, CustomerName, SegmentID FROM staging_Customer_Dimension
+        WHERE rowid IN (SELECT MIN(rowid) FROM staging_Customer_Dimension GROUP BY CustomerID)
+        ON CONFLICT (CustomerID) DO UPDATE SET CustomerName = excluded.CustomerName, SegmentID = excluded.SegmentID
+    """,
+    "master.ProductCategories": """
+        INSERT INTO master_ProductCategories (CategoryID, CategoryName)
+        SELECT CategoryID, CategoryName FROM staging_Product_Category_Dimension
+        WHERE rowid IN (SELECT MIN(rowid) FROM staging_Product_Category_Dimension GROUP BY CategoryID)
+        ON CONFLICT (CategoryID) DO UPDATE SET CategoryName = excluded.CategoryName
+    """,
+    "master.ProductSubCategories": """
+        INSERT INTO master_ProductSubCategories (SubCategoryID, SubCategoryName, CategoryID)
+        SELECT p.SubCategoryID, p.SubCategory,
+               (SELECT MIN(c.CategoryID) FROM staging_Product_Category_Dimension c WHERE c.SubCategoryID = p.SubCategoryID)
+        FROM staging_Product_Dimension p
+        WHERE p.rowid IN (SELECT MIN(rowid) FROM staging_Product_Dimension GROUP BY SubCategoryID)
+        ON CONFLICT (SubCategoryID) DO UPDATE SET SubCategoryName = excluded.SubCategoryName, CategoryID = excluded.CategoryID
+    """,
+    "master.Products": """
+        INSERT INTO master_Products (ProductID, ProductName, SubCategoryID)
+        SELECT ProductID, ProductName, SubCategoryID FROM staging_Product_Dimension
+        WHERE rowid IN (SELECT MIN(rowid) FROM staging_Product_Dimension GROUP BY ProductID)
+        ON CONFLICT (ProductID) DO UPDATE SET ProductName = excluded.ProductName, SubCategoryID = excluded.SubCategoryID
+    """,
+    "master.Regions": """
+        INSERT INTO master_Regions (RegionID, RegionName)
+        SELECT RegionID, RegionName FROM staging_Region_Dimension
+        WHERE rowid IN (SELECT MIN(rowid) FROM staging_Region_Dimension GROUP BY RegionID)
+        ON CONFLICT (RegionID) DO UPDATE SET RegionName = excluded.RegionName
+    """,
+    "master.Geographies": """
+        INSERT INTO master_Geographies (GeographyID, Country, State, City, PostalCode, RegionID)
+        SELECT GeographyID, Country, State, City, PostalCode, RegionID FROM staging_Geography_Dimension
+        WHERE rowid IN (SELECT MIN(rowid) FROM staging_Geography_Dimension GROUP BY GeographyID)
+        ON CONFLICT (GeographyID) DO UPDATE SET Country = excluded.Country, State = excluded.State, City = excluded.City,
+            PostalCode = excluded.PostalCode, RegionID = excluded.RegionID
+    """,
+    "master.Time": """
+        INSERT INTO master_Time (DateID, CalendarDate, Year, Quarter, Month, Week, Weekday, FiscalYear, FiscalPeriod)
+        SELECT DateID, CalendarDate, Year, Quarter, Month, Week, Weekday, FiscalYear, FiscalPeriod FROM staging_Time_Dimension
+        WHERE rowid IN (SELECT MIN(rowid) FROM staging_Time_Dimension GROUP BY DateID)
+        ON CONFLICT (DateID) DO UPDATE SET CalendarDate = excluded.CalendarDate, Year = excluded.Year, Quarter = excluded.Quarter,
+            Month = excluded.Month, Week = excluded.Week, Weekday = excluded.Weekday, FiscalYear = excluded.FiscalYear,
+            FiscalPeriod = excluded.FiscalPeriod
+    """,
+    # The fact mart is a full snapshot, so the fact table is replaced; ID 0 marks a dimension miss and loads as NULL
+    "transaction.Sales": """
+        DELETE FROM transaction_Sales;
+        INSERT INTO transaction_Sales (OrderID, ProductID, CustomerID, OrderDateID, ShipDateID, GeographyID, ShipMode, Sales, Quantity, Discount, Profit)
+        SELECT OrderID, ProductID, CustomerID, NULLIF(OrderDateID, 0), NULLIF(ShipDateID, 0), NULLIF(GeographyID, 0),
+               ShipMode, Sales, Quantity, Discount, Profit
+        FROM staging_Sales_Fact
+    """,
+}
+
+# Function to translate the SQL Server DDL into SQLite statements.
+# CREATE DATABASE, USE and CREATE SCHEMA are dropped, schema.Table becomes schema_Table and IDENTITY columns become
+# SQLite rowid aliases. Returns a dict of table name (as in the DDL) -> CREATE TABLE statement.
+def translate_ddl(ddl):
+    ddl = re.sub(r'--[^\n]*', '', ddl)
+    tables = {}
+    for statement in ddl.split(';'):
+        statement = statement.strip()
+        match = re.match(r'CREATE TABLE (\w+\.\w+)', statement)
+        if not match:
+            continue
+        statement = re.sub(r'\b(%s)\.(\w+)' % '|'.join(schemas), r'\1_\2', statement)
+        statement = re.sub(r'INT IDENTITY\(1,\s*1\) PRIMARY KEY', 'INTEGER PRIMARY KEY', statement)
+        tables[match.group(1)] = statement
+    return tables
+
+# Function to order the tables so that every table comes after the tables its foreign keys reference
+def dependency_order(tables):
+    references = {name: set(re.findall(r'REFERENCES (\w+)_(\w+)', statement)) for name, statement in tables.items()}
+    references = {name: {f"{schema}.{table}" for schema, table in refs} - {name} for name, refs in references.items()}
+    ordered = []
+    while len(ordered) < len(tables):
+        ready = [name for name in tables if name not in ordered and references[name] <= set(ordered)]
+        if not ready:
+            raise ValueError(f"Circular or missing foreign key references between: {sorted(set(tables) - set(ordered))}")
+        ordered.extend(ready)
+    return ordered
+
+# Function to create the data warehouse tables that do not exist yet, in dependency order
+def create_schema(connection, tables):
+    for name in dependency_order(tables):
+        connection.execute(tables[name].replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS", 1))
+
+# Function to get the table and column name of a data mart column in SQL, e.g. 'Sub-Category ID' -> SubCategoryID
+def sql_name(name):
+    return re.sub(r'[^0-9A-Za-z_]', '', name)
+
+# Function to bulk-load a data mart CSV file into its staging table in batches with executemany.
+# Returns the number of rows loaded.
+def load_staging(connection, mart_path, table, batch_size):
+    connection.execute(f"DELETE FROM {table}")
+    rows = 0
+    for chunk in pd.read_csv(mart_path, dtype=str, keep_default_na=False, chunksize=batch_size):
+        columns = [sql_name(col) for col in chunk.columns]
+        placeholders = ", ".join("?" for _ in columns)
+        # Empty fields load as NULL
+        chunk = chunk.astype(object).where(chunk != '', None)
+        connection.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+                               chunk.itertuples(index=False, name=None))
+        rows += len(chunk)
+    return rows
+
+# Function to print the load rate of a table
+def report_rate(name, rows, seconds):
+    rate = rows / seconds if seconds > 0 else float('inf')
+    print(f"{name}: {rows} rows in {seconds:.2f} s ({rate:,.0f} rows/s)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the Task 6 data marts into the Task 4 RetailDWH schema in a SQLite database.")
+    parser.add_argument('--database', default="RetailDWH.sqlite",
+                        help="SQLite database file to create or update (default: RetailDWH.sqlite)")
+    parser.add_argument('--batch-size', type=int, default=10000,
+                        help="Number of rows inserted per executemany batch (default: 10000)")
+    args = parser.parse_args()
+
+    with open(ddl_path) as file:
+        tables = translate_ddl(file.read())
+
+    connection = sqlite3.connect(args.database, isolation_level=None)
+    try:
+        connection.execute("PRAGMA foreign_keys = ON")
+        create_schema(connection, tables)
+
+        # Load everything in one transaction; foreign keys are only checked when it commits
+        connection.execute("BEGIN")
+        connection.execute("PRAGMA defer_foreign_keys = ON")
+
+        # Bulk-load each data mart into its staging table
+        for name in tables:
+            schema, mart = name.split('.')
+            if schema != 'staging':
+                continue
+            mart_path = os.path.join(marts_dir, f"{mart}.csv")
+            if not os.path.exists(mart_path):
+                print(f"Error: {mart_path} not found. Please run Task_6_script.py first.")
+                connection.execute("ROLLBACK")
+                return
+            start = time.perf_counter()
+            rows = load_staging(connection, mart_path, f"staging_{mart}", args.batch_size)
+            report_rate(name, rows, time.perf_counter() - start)
+
+        # Merge the staging tables into the master and transaction tables
+        for name in dependency_order({name: tables[name] for name in merge_statements}):
+            start = time.perf_counter()
+            for statement in merge_statements[name].split(';'):
+                if statement.strip():
+                    rows = connection.execute(statement).rowcount
+            report_rate(name, rows, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        connection.execute("COMMIT")
+        print(f"Foreign keys checked and load committed in {time.perf_counter() - start:.2f} s")
+    except sqlite3.IntegrityError as e:
+        print(f"Error: the load violates a constraint and was rolled back: {e}")
+        for table, rowid, parent, fkid in connection.execute("PRAGMA foreign_key_check"):
+            print(f"  {table} row {rowid} references a missing row in {parent}")
+        if connection.in_transaction:
+            connection.execute("ROLLBACK")
+        return
+    finally:
+        connection.close()
+
+    print(f"{args.database} has been loaded successfully.")
+
+if __name__ == "__main__":
+    main()
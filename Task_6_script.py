@@ -1,179 +1,121 @@
-import pandas as pd
 import os
+import time
 import zipfile
+import argparse
+import contextlib
+from pipeline import extract, cleanse, model, aggregates, export, metrics, sketch
 
 # Directory containing CSV files
 data_dir = os.path.expanduser("Case_Study_Data_For_Share")
 
-# Initialize lists to hold dataframes
-dataframes = []
-
-# Function to extract data from a single CSV file
-def extract_data(file_path):
-    try:
-        with open(file_path, 'r') as file:
-            lines = file.readlines()
-            data = [line.strip().split('|') for line in lines]
-            df = pd.DataFrame(data[1:], columns=data[0])
-            return df
-    except Exception as e:
-        print(f"Error reading {file_path}: {e}")
-        return None
-
-# Extract data from all files
-for file_name in os.listdir(data_dir):
-    if file_name.endswith(".csv"):
-        file_path = os.path.join(data_dir, file_name)
-        df = extract_data(file_path)
-        if df is not None:
-            dataframes.append(df)
-
-# Combine all dataframes into one
-if not dataframes:
-    print("No dataframes were loaded. Please check the file paths and formats.")
-else:
-    all_data = pd.concat(dataframes, ignore_index=True)
-
-# Data Cleansing Function
-def clean_data(df):
-    # Remove duplicates
-    df.drop_duplicates(inplace=True)
-
-    # Handle missing values
-    df['Customer Name'].fillna('Unknown', inplace=True)
-    df.dropna(subset=['Order ID', 'Product ID', 'Customer ID', 'Order Date', 'Sales'], inplace=True)
-
-    # Correct data types
-    df['Order Date'] = pd.to_datetime(df['Order Date'], errors='coerce')
-    df['Ship Date'] = pd.to_datetime(df['Ship Date'], errors='coerce')
-    df['Sales'] = pd.to_numeric(df['Sales'], errors='coerce')
-    df['Quantity'] = pd.to_numeric(df['Quantity'], errors='coerce')
-    df['Discount'] = pd.to_numeric(df['Discount'], errors='coerce')
-    df['Profit'] = pd.to_numeric(df['Profit'], errors='coerce')
-    df['Postal Code'] = df['Postal Code'].astype(str)
-
-    # Remove records with zero sales and zero quantity
-    df = df[~((df['Sales'] == 0) & (df['Quantity'] == 0))]
-
-    # Remove records where the ship date is before the order date
-    df = df[~(df['Ship Date'] < df['Order Date'])]
-
-    # Remove records with negative profit values
-    df = df[df['Profit'] >= 0]
-
-    # Remove records with invalid postal codes (assuming US postal codes here for simplicity)
-    df = df[df['Postal Code'].str.match(r'^\d{5}(-\d{4})?$')]
-
-    return df
-
-# Clean the combined data
-cleaned_data = clean_data(all_data)
-
-# Ensure 'Postal Code' column exists
-if 'Postal Code' not in cleaned_data.columns:
-    print("Error: 'Postal Code' column is missing from the cleaned data.")
-else:
-    print("Success: 'Postal Code' column found in the cleaned data.")
-
 # Directory to save the Data Marts CSV files
 output_dir = "Data_Marts"
-os.makedirs(output_dir, exist_ok=True)
-
-# Create Dimension Tables
-customer_dim = cleaned_data[['Customer ID', 'Customer Name', 'Segment']].drop_duplicates().copy()
-customer_dim['Segment ID'] = pd.factorize(customer_dim['Segment'])[0] + 1
-
-product_dim = cleaned_data[['Product ID', 'Product Name', 'Sub-Category', 'Category']].drop_duplicates().copy()
-product_dim['Sub-Category ID'] = pd.factorize(product_dim['Sub-Category'])[0] + 1
-
-geography_dim = cleaned_data[['Country', 'State', 'City', 'Postal Code', 'Region']].drop_duplicates().copy()
-geography_dim['Geography ID'] = pd.factorize(geography_dim.apply(lambda x: f"{x['Country']}_{x['State']}_{x['Postal Code']}", axis=1))[0] + 1
-geography_dim['Region ID'] = pd.factorize(geography_dim['Region'])[0] + 1
-
-time_dim = cleaned_data[['Order Date', 'Ship Date']].drop_duplicates().copy()
-time_dim['Date ID'] = pd.factorize(time_dim['Order Date'].astype(str) + "_" + time_dim['Ship Date'].astype(str))[0] + 1
-
-segment_dim = customer_dim[['Segment ID', 'Segment']].drop_duplicates().copy()
-segment_dim.columns = ['Segment ID', 'Segment Name']
-
-product_category_dim = product_dim[['Sub-Category ID', 'Category']].drop_duplicates().copy()
-product_category_dim['Category ID'] = pd.factorize(product_category_dim['Category'])[0] + 1
-product_category_dim['Category Name'] = product_category_dim['Category']
-
-region_dim = geography_dim[['Region', 'Region ID']].drop_duplicates().copy()
-region_dim.columns = ['Region Name', 'Region ID']
-
-# Create Fact Table
-sales_fact = cleaned_data[['Order ID', 'Product ID', 'Customer ID', 'Order Date', 'Ship Date', 'Sales', 'Quantity', 'Discount', 'Profit', 'Postal Code']].copy()
-sales_fact['Date ID'] = pd.factorize(sales_fact['Order Date'].astype(str) + "_" + sales_fact['Ship Date'].astype(str))[0] + 1
-
-# Debugging: Check if 'Postal Code' column exists in both DataFrames
-print(f"Columns in sales_fact: {sales_fact.columns}")
-print(f"Columns in geography_dim: {geography_dim.columns}")
-
-# Ensure 'Postal Code' column exists before merging
-if 'Postal Code' in sales_fact.columns and 'Postal Code' in geography_dim.columns:
-    sales_fact = sales_fact.merge(geography_dim[['Postal Code', 'Geography ID']], on='Postal Code', how='left')
-else:
-    print("Error: 'Postal Code' column is missing from one of the DataFrames.")
-
-# Save data marts to CSV files
-customer_dim.to_csv(os.path.join(output_dir, "Customer_Dimension.csv"), index=False)
-product_dim.to_csv(os.path.join(output_dir, "Product_Dimension.csv"), index=False)
-geography_dim.to_csv(os.path.join(output_dir, "Geography_Dimension.csv"), index=False)
-time_dim.to_csv(os.path.join(output_dir, "Time_Dimension.csv"), index=False)
-segment_dim.to_csv(os.path.join(output_dir, "Segment_Dimension.csv"), index=False)
-product_category_dim.to_csv(os.path.join(output_dir, "Product_Category_Dimension.csv"), index=False)
-region_dim.to_csv(os.path.join(output_dir, "Region_Dimension.csv"), index=False)
-sales_fact.to_csv(os.path.join(output_dir, "Sales_Fact.csv"), index=False)
-
-# Create a zip archive of the data marts
-with zipfile.ZipFile("Task_6_1_Data_Marts.zip", 'w') as zipf:
-    for root, dirs, files in os.walk(output_dir):
-        for file in files:
-            zipf.write(os.path.join(root, file), file)
-
-# Count rows and distinct primary keys
-data_mart_stats = {
-    "Customer_Dimension": {
-        "rows": len(customer_dim),
-        "distinct_primary_keys": len(customer_dim['Customer ID'].unique())
-    },
-    "Product_Dimension": {
-        "rows": len(product_dim),
-        "distinct_primary_keys": len(product_dim['Product ID'].unique())
-    },
-    "Geography_Dimension": {
-        "rows": len(geography_dim),
-        "distinct_primary_keys": len(geography_dim['Geography ID'].unique())
-    },
-    "Time_Dimension": {
-        "rows": len(time_dim),
-        "distinct_primary_keys": len(time_dim['Date ID'].unique())
-    },
-    "Segment_Dimension": {
-        "rows": len(segment_dim),
-        "distinct_primary_keys": len(segment_dim['Segment ID'].unique())
-    },
-    "Product_Category_Dimension": {
-        "rows": len(product_category_dim),
-        "distinct_primary_keys": len(product_category_dim['Category ID'].unique())
-    },
-    "Region_Dimension": {
-        "rows": len(region_dim),
-        "distinct_primary_keys": len(region_dim['Region ID'].unique())
-    },
-    "Sales_Fact": {
-        "rows": len(sales_fact),
-        "distinct_primary_keys": len(sales_fact['Order ID'].unique()),
-        "distinct_row_ids": len(sales_fact['Date ID'].unique()) if 'Date ID' in sales_fact.columns else 'N/A'
-    }
-}
-
-# Save the data mart statistics to a CSV file
-stats_df = pd.DataFrame.from_dict(data_mart_stats, orient='index')
-stats_df.reset_index(inplace=True)
-stats_df.columns = ['Data Mart System Name', 'Count Rows', 'Count Distinct Primary Key', 'Count Distinct Row ID']
-stats_df.to_csv("Task_6_2_Data_Marts_Rows.csv", index=False)
-
-print("Task_6 deliverables created successfully.")
+
+# Function to run the Task 6 stages, recording the metrics of each
+def run(args):
+    os.makedirs(output_dir, exist_ok=True)
+    compression = None if args.compression == 'none' else args.compression
+
+    # Feed the quarantined rows that were fixed since the last run back in as a new source file of the replay directory
+    if args.replay_quarantine:
+        cleanse.replay_quarantine(args.quarantine_dir, os.path.join(args.replay_dir, f"Quarantine_Replay_{time.strftime('%Y%m%d%H%M%S')}.csv"))
+
+    if args.backend == 'duckdb':
+        # Scan and cleanse the source files in DuckDB; the dimensions and the fact table are built there too
+        from pipeline import duckdb_backend
+        with metrics.stage('cleanse') as record:
+            cleansed = duckdb_backend.cleanse(data_dir, args.chunk_size, args.memory_limit, args.replay_dir)
+            if cleansed is not None:
+                record.update({name: cleansed[name] for name in ('rows_in', 'rows_out', 'dropped', 'coerced', 'cached')})
+        if cleansed is None:
+            print("No dataframes were loaded. Please check the file paths and formats.")
+            return
+        modeler = duckdb_backend
+        aggregator = duckdb_backend
+    else:
+        # Extract and cleanse the source files, reusing the cleansed data of Task_5_script.py when it ran on the same files
+        with metrics.stage('extract') as record:
+            entries = extract.extract_files(data_dir, args.chunk_size, full_refresh=args.full_refresh, memory_report=args.memory_report, replay_dir=args.replay_dir)
+            record.update(files=len(entries), rows_out=sum(entry['rows'] for entry in entries), coerced=extract.coerced_values(entries))
+        if not entries:
+            print("No dataframes were loaded. Please check the file paths and formats.")
+            return
+
+        with metrics.stage('cleanse') as record:
+            cleansed = cleanse.cleanse(entries)
+            record.update({name: cleansed[name] for name in ('rows_in', 'rows_out', 'dropped', 'cached')})
+        modeler = model
+        aggregator = aggregates
+
+    # Save the rejected rows with their reasons and source files
+    cleanse.export_quarantine(cleansed, args.quarantine_dir)
+
+    # Create Dimension Tables
+    with metrics.stage('dimensions') as record:
+        data_marts = modeler.model_dimensions(cleansed)
+        record.update(rows_in=cleansed['rows_out'], rows_out={name: len(data_mart) for name, data_mart in data_marts.items()})
+
+    # Save the data marts, creating the zip archive of the CSV files as they are written
+    zip_archive = args.export_format == 'csv' and not args.no_zip
+    with (zipfile.ZipFile("Task_6_1_Data_Marts.zip", 'w', compression=zipfile.ZIP_DEFLATED) if zip_archive else contextlib.nullcontext()) as zipf:
+        with metrics.stage('export_dimensions') as record:
+            for name, data_mart in data_marts.items():
+                export.export_mart(name, [data_mart], output_dir, args.export_format, compression, zipf)
+            record.update(rows_out=sum(len(data_mart) for data_mart in data_marts.values()))
+
+        # Create Fact Table; its keys are joined chunk by chunk while it is exported
+        with metrics.stage('sales_fact') as record:
+            fact_stats = model.new_fact_stats(args.distinct_counts)
+            sales_fact_chunks = modeler.key_sales_fact(cleansed, data_marts["Geography_Dimension"], fact_stats)
+            export.export_mart("Sales_Fact", sales_fact_chunks, output_dir, args.export_format, compression, zipf)
+            record.update(rows_in=cleansed['rows_out'], rows_out=fact_stats['rows'],
+                          join_seconds=round(fact_stats.get('join_seconds', 0), 3))
+
+        # Create the aggregate marts; only the cleansed chunks that are new or changed since the last run are re-aggregated
+        with metrics.stage('aggregates') as record:
+            aggregate_marts = aggregates.build_aggregates(aggregator.aggregate_cube(cleansed), data_marts)
+            for name, aggregate in aggregate_marts.items():
+                export.export_mart(name, [aggregate], output_dir, args.export_format, compression, zipf)
+            record.update(rows_in=cleansed['rows_out'], rows_out={name: len(aggregate) for name, aggregate in aggregate_marts.items()})
+
+    # Save the data mart statistics to a CSV file
+    with metrics.stage('statistics'):
+        export.write_stats(data_marts, fact_stats, "Task_6_2_Data_Marts_Rows.csv", aggregate_marts)
+
+    print("Task_6 deliverables created successfully.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Create the Task 6 data marts.")
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help="Stream the source files in chunks of this many rows so memory depends on the chunk size, not the file size (default: read whole files)")
+    parser.add_argument('--full-refresh', action='store_true',
+                        help="Ignore the cache and re-read and re-cleanse every source file")
+    parser.add_argument('--export-format', choices=['csv', 'parquet'], default='csv',
+                        help="Write the data marts as CSV files (archived in Task_6_1_Data_Marts.zip) or as typed Parquet with Sales_Fact partitioned by order year and month (default: csv)")
+    parser.add_argument('--compression', choices=['snappy', 'zstd', 'gzip', 'brotli', 'lz4', 'none'], default='snappy',
+                        help="Compression codec of the Parquet files (default: snappy)")
+    parser.add_argument('--no-zip', action='store_true',
+                        help="Do not build Task_6_1_Data_Marts.zip when exporting CSV files")
+    parser.add_argument('--backend', choices=['pandas', 'duckdb'], default='pandas',
+                        help="Engine of the cleanse, dimension and fact stages: cached pandas chunks, or DuckDB queries over the source files that use all cores and spill to disk (default: pandas)")
+    parser.add_argument('--memory-limit', default=None,
+                        help="Memory limit of the DuckDB backend, e.g. 4GB; beyond it DuckDB spills to .etl_cache/duckdb (default: 80%% of RAM)")
+    parser.add_argument('--distinct-counts', choices=sketch.sketch_kinds, default='exact',
+                        help="Count the distinct keys of the statistics file exactly, or estimate them with HyperLogLog sketches of constant memory (default: exact)")
+    parser.add_argument('--memory-report', action='store_true',
+                        help="Print the memory use of each column of the parsed files before and after the schema is applied")
+    parser.add_argument('--quarantine-dir', default=cleanse.default_quarantine_dir,
+                        help=f"Directory of the Parquet dataset of the rows rejected by the cleansing, with their reason codes and source files (default: {cleanse.default_quarantine_dir})")
+    parser.add_argument('--replay-quarantine', action='store_true',
+                        help="Before extracting, write the quarantined rows that now pass the cleansing rules to a new source file in --replay-dir, so rows fixed in the quarantine are loaded")
+    parser.add_argument('--replay-dir', default=cleanse.default_replay_dir,
+                        help=f"Directory of the replayed quarantine rows, read after the source files on every run (default: {cleanse.default_replay_dir})")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+
+    metrics.configure("Task_6_script", args)
+    with metrics.profiler(args.profile_output), metrics.stage('total'):
+        run(args)
+
+if __name__ == "__main__":
+    main()
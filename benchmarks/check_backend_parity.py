@@ -0,0 +1,145 @@
+import os
+import sys
+import shutil
+import argparse
+import pandas as pd
+
+# Make the pipeline package importable when the script is run from any directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pipeline import cache, keys, extract, cleanse, model, aggregates, duckdb_backend
+from generate_data import generate_files
+
+# Backends compared, each run with its own cache and key registry
+backends = ['pandas', 'duckdb']
+
+# Format the dates of the day-first variant file are rewritten in
+day_first_format = '%d.%m.%Y'
+
+# Function to read a source file as it was written, every value a string
+def read_source(file_path):
+    return pd.read_csv(file_path, sep='|', dtype=str, keep_default_na=False)
+
+# Function to add the cases the generated files do not cover to the dataset:
+# - the second file repeats rows of the first, so duplicates span files;
+# - the first file has a product name with a newline in a quoted field;
+# - the third file has its dates in day-first order, so each file's own date format is detected, and ends with a row
+#   that has fewer fields than the header;
+# - the last file is missing a column, so the columns of the files differ;
+# - an empty file, which cannot be read and is skipped.
+def add_variants(file_paths):
+    first, second = read_source(file_paths[0]), read_source(file_paths[1])
+    first.loc[first.index[-1], 'Product Name'] = "Two-line\nproduct name"
+    first.to_csv(file_paths[0], sep='|', index=False)
+    pd.concat([second, first.head(50)]).to_csv(file_paths[1], sep='|', index=False)
+
+    third = read_source(file_paths[2])
+    for col in extract.date_columns:
+        dates = pd.to_datetime(third[col], format=extract.date_format, errors='coerce')
+        third[col] = dates.dt.strftime(day_first_format).where(dates.notna(), third[col])
+    third.to_csv(file_paths[2], sep='|', index=False)
+    with open(file_paths[2], 'a') as file:
+        file.write("|".join(third.iloc[0, :10]) + "\n")
+
+    last = read_source(file_paths[-1])
+    last.drop(columns='Discount').to_csv(file_paths[-1], sep='|', index=False)
+
+    open(os.path.join(os.path.dirname(file_paths[-1]), "part_empty.csv"), 'w').close()
+
+# Function to run the cleanse, model and aggregate stages of a backend on the dataset.
+# Returns the outputs compared between the backends as CSV text: every data mart, the aggregate marts, the quarantined
+# rows sorted (the backends write them in parts of different sizes) and the row counts.
+def run_backend(backend, data_dir, work_dir, chunk_size):
+    cache.cache_dir = os.path.join(work_dir, ".etl_cache")
+    keys.registry_dir = os.path.join(work_dir, ".key_registry")
+    for state_dir in (cache.cache_dir, keys.registry_dir):
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+    if backend == 'duckdb':
+        cleansed = duckdb_backend.cleanse(data_dir, chunk_size)
+        coerced = cleansed['coerced']
+        modeler = aggregator = duckdb_backend
+    else:
+        entries = extract.extract_files(data_dir, chunk_size, full_refresh=True)
+        cleansed = cleanse.cleanse(entries)
+        coerced = extract.coerced_values(entries)
+        modeler, aggregator = model, aggregates
+
+    data_marts = modeler.model_dimensions(cleansed)
+    outputs = {name: data_mart.to_csv(index=False) for name, data_mart in data_marts.items()}
+    fact_stats = model.new_fact_stats()
+    fact_chunks = list(modeler.key_sales_fact(cleansed, data_marts["Geography_Dimension"], fact_stats))
+    outputs["Sales_Fact"] = pd.concat(fact_chunks).to_csv(index=False)
+    for name, aggregate in aggregates.build_aggregates(aggregator.aggregate_cube(cleansed), data_marts).items():
+        outputs[name] = aggregate.to_csv(index=False)
+
+    quarantine = pd.concat([pd.read_parquet(path) for path in cleansed['quarantine']]).to_csv(index=False).splitlines()
+    outputs["Quarantine"] = "\n".join(quarantine[:1] + sorted(quarantine[1:]))
+    counts = {'rows_in': cleansed['rows_in'], 'rows_out': cleansed['rows_out'], 'dropped': cleansed['dropped'],
+              'coerced': dict(sorted(coerced.items()))}
+    outputs["Row Counts"] = "\n".join(f"{name}: {value}" for name, value in counts.items())
+    return outputs
+
+# Function to compare the outputs of the backends, printing each output that differs with its first differing line.
+# Returns the names of the outputs that differ.
+def compare_outputs(outputs):
+    expected, actual = outputs['pandas'], outputs['duckdb']
+    mismatches = []
+    for name in expected.keys() | actual.keys():
+        if expected.get(name) == actual.get(name):
+            continue
+        mismatches.append(name)
+        if name not in expected or name not in actual:
+            print(f"{name}: only produced by the {'pandas' if name in expected else 'duckdb'} backend")
+            continue
+        expected_lines, actual_lines = expected[name].splitlines(), actual[name].splitlines()
+        for i, (expected_line, actual_line) in enumerate(zip(expected_lines, actual_lines)):
+            if expected_line != actual_line:
+                print(f"{name}: line {i + 1} differs\n  pandas: {expected_line}\n  duckdb: {actual_line}")
+                break
+        else:
+            print(f"{name}: {len(expected_lines)} lines with pandas, {len(actual_lines)} with duckdb")
+    return sorted(mismatches)
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the pandas and DuckDB backends build the same data marts and quarantine from the same source files.")
+    parser.add_argument('--rows', type=int, default=50000,
+                        help="Number of rows of the synthetic dataset (default: 50000)")
+    parser.add_argument('--files', type=int, default=4,
+                        help="Number of files the dataset is split over, at least 3 (default: 4)")
+    parser.add_argument('--chunk-size', type=int, default=10000,
+                        help="Chunk size both backends read and fetch the data in (default: 10000)")
+    parser.add_argument('--seed', type=int, default=1,
+                        help="Seed of the data generator (default: 1)")
+    parser.add_argument('--work-dir', default=os.path.join("benchmarks", "parity"),
+                        help="Directory for the dataset and the caches of both backends; it is recreated on every run (default: benchmarks/parity)")
+    args = parser.parse_args()
+    if args.files < 3:
+        parser.error("--files must be at least 3")
+
+    shutil.rmtree(args.work_dir, ignore_errors=True)
+    data_dir = os.path.join(args.work_dir, "data")
+    file_paths = generate_files(data_dir, args.rows, args.files, anomaly_rates={"Invalid Data Formats": 0.01}, seed=args.seed)
+    add_variants(file_paths)
+
+    outputs = {}
+    for backend in backends:
+        print(f"\nRunning the {backend} backend")
+        outputs[backend] = run_backend(backend, data_dir, os.path.join(args.work_dir, backend), args.chunk_size)
+
+    # Neither backend loads anything from a directory without source files
+    empty_dir = os.path.join(args.work_dir, "empty")
+    os.makedirs(empty_dir)
+    empty_results = {'pandas': extract.extract_files(empty_dir), 'duckdb': duckdb_backend.cleanse(empty_dir)}
+
+    mismatches = compare_outputs(outputs)
+    print()
+    if empty_results['pandas'] or empty_results['duckdb'] is not None:
+        print("The backends do not both load nothing from a directory without source files.")
+        mismatches.append("Empty Directory")
+    if mismatches:
+        print(f"{len(mismatches)} outputs differ between the backends: {', '.join(mismatches)}")
+        sys.exit(1)
+    print(f"The backends produced the same {len(outputs['pandas'])} outputs.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+
+# Make the pipeline package importable when the script is run from any directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pipeline import extract, profile
+
+# Number of rows generated and written at a time, so memory does not depend on the total row count
+batch_size = 1000000
+
+# Default injection rate of each anomaly profile_data detects, as a fraction of rows.
+# "Missing Columns" is the fraction of files written without one of the required columns.
+default_anomaly_rates = {
+    "Missing Columns": 0.0,
+    "Invalid Data Formats": 0.001,
+    "Zero Sales and Quantity": 0.001,
+    "Negative Sales Values": 0.001,
+    "Unrealistic Discount Values": 0.001,
+    "Invalid Postal Codes": 0.001,
+    "Inconsistent Country Names": 0.001,
+    "Mismatched Order and Ship Dates": 0.001,
+    "Inconsistent Customer IDs": 0.001,
+    "Negative Profit Values": 0.1,
+}
+
+# Reference data the rows are drawn from
+states = {
+    'California': 'West', 'Washington': 'West', 'Texas': 'Central', 'Illinois': 'Central', 'Ohio': 'East',
+    'New York': 'East', 'Pennsylvania': 'East', 'Florida': 'South', 'Georgia': 'South', 'Virginia': 'South',
+}
+sub_categories = {
+    'Bookcases': 'Furniture', 'Chairs': 'Furniture', 'Tables': 'Furniture', 'Furnishings': 'Furniture',
+    'Phones': 'Technology', 'Machines': 'Technology', 'Copiers': 'Technology', 'Accessories': 'Technology',
+    'Paper': 'Office Supplies', 'Binders': 'Office Supplies', 'Storage': 'Office Supplies', 'Art': 'Office Supplies',
+}
+ship_modes = ['Standard Class', 'Second Class', 'First Class', 'Same Day']
+segments = ['Consumer', 'Corporate', 'Home Office']
+discounts = [0, 0, 0, 0.1, 0.15, 0.2, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8]
+
+# Function to build the pools of customers, products and geographies the rows are drawn from.
+# Pool sizes grow with the row count so the dimensions grow with the data, as they do in production.
+def build_pools(rows, rng):
+    n_customers = int(np.clip(rows // 20, 100, 500000))
+    n_products = int(np.clip(rows // 50, 100, 50000))
+    n_geographies = int(np.clip(rows // 200, 50, 20000))
+    geography_states = rng.choice(list(states), n_geographies)
+    product_sub_categories = rng.choice(list(sub_categories), n_products)
+    # Order dates cover 2014-2017; the extra days before and after leave room for ship dates and mismatches
+    dates = pd.date_range(pd.Timestamp('2014-01-01') - pd.Timedelta(days=10), periods=4 * 365 + 30)
+    return {
+        'customer_id': np.array([f"CU-{i:06d}" for i in range(n_customers)], dtype=object),
+        'customer_name': np.array([f"Customer {i}" for i in range(n_customers)], dtype=object),
+        'segment': rng.choice(segments, n_customers),
+        'product_id': np.array([f"PR-{i:07d}" for i in range(n_products)], dtype=object),
+        'product_name': np.array([f"Product {i}" for i in range(n_products)], dtype=object),
+        'sub_category': product_sub_categories,
+        'category': np.array([sub_categories[s] for s in product_sub_categories], dtype=object),
+        'state': geography_states,
+        'region': np.array([states[s] for s in geography_states], dtype=object),
+        'city': np.array([f"City {i % max(1, n_geographies // 3)}" for i in range(n_geographies)], dtype=object),
+        'postal_code': np.array([f"{code:05d}" for code in rng.choice(np.arange(10000, 100000), n_geographies, replace=False)], dtype=object),
+        'dates': np.array([f"{d.month}/{d.day}/{d.year}" for d in dates], dtype=object),
+        'years': dates.year.astype(str).to_numpy(dtype=object),
+    }
+
+# Function to generate a batch of rows with the anomalies injected at the given rates.
+# first_row is the Row ID of the first row; duplicates are exact copies of other rows of the batch.
+def generate_batch(first_row, n, pools, duplicate_rate, anomaly_rates, rng):
+    customer = rng.integers(0, len(pools['customer_id']), n)
+    product = rng.integers(0, len(pools['product_id']), n)
+    geography = rng.integers(0, len(pools['state']), n)
+    order_day = rng.integers(10, 10 + 4 * 365, n)
+    ship_day = order_day + rng.integers(0, 8, n)
+    order_number = (np.arange(first_row, first_row + n) // 3).astype(str).astype(object)
+
+    sales = np.round(rng.gamma(1.5, 150, n), 4)
+    quantity = rng.integers(1, 15, n)
+    discount = rng.choice(discounts, n)
+    profit = np.round(sales * rng.uniform(0.01, 0.4, n), 4)
+
+    df = pd.DataFrame({
+        'Row ID': np.arange(first_row, first_row + n),
+        'Order ID': "CA-" + pools['years'][order_day] + "-" + order_number,
+        'Order Date': pools['dates'][order_day],
+        'Ship Date': pools['dates'][ship_day],
+        'Ship Mode': rng.choice(ship_modes, n),
+        'Customer ID': pools['customer_id'][customer],
+        'Customer Name': pools['customer_name'][customer],
+        'Segment': pools['segment'][customer],
+        'Country': 'United States',
+        'City': pools['city'][geography],
+        'State': pools['state'][geography],
+        'Postal Code': pools['postal_code'][geography],
+        'Region': pools['region'][geography],
+        'Product ID': pools['product_id'][product],
+        'Category': pools['category'][product],
+        'Sub-Category': pools['sub_category'][product],
+        'Product Name': pools['product_name'][product],
+        'Sales': sales,
+        'Quantity': quantity,
+        'Discount': discount,
+        'Profit': profit,
+    }, columns=extract.source_columns)
+
+    # Inject each row-level anomaly into an independent random sample of rows
+    def sample(name):
+        return rng.random(n) < anomaly_rates.get(name, 0)
+
+    df.loc[sample("Invalid Data Formats"), 'Order Date'] = "00/00/0000"
+    mask = sample("Zero Sales and Quantity")
+    df.loc[mask, ['Sales', 'Quantity']] = 0
+    mask = sample("Negative Sales Values")
+    df.loc[mask, 'Sales'] = -df.loc[mask, 'Sales']
+    mask = sample("Unrealistic Discount Values")
+    df.loc[mask, 'Discount'] = rng.choice([-0.2, 1.5], mask.sum())
+    df.loc[sample("Invalid Postal Codes"), 'Postal Code'] = "ABC12"
+    df.loc[sample("Inconsistent Country Names"), 'Country'] = "USA"
+    mask = sample("Mismatched Order and Ship Dates")
+    df.loc[mask, 'Ship Date'] = pools['dates'][order_day[mask] - rng.integers(1, 10, mask.sum())]
+    mask = sample("Inconsistent Customer IDs")
+    df.loc[mask, 'Customer ID'] = pools['customer_id'][rng.integers(0, len(pools['customer_id']), mask.sum())]
+    mask = sample("Negative Profit Values")
+    df.loc[mask, 'Profit'] = -df.loc[mask, 'Profit']
+
+    # Replace a sample of rows by exact copies of other rows of the batch
+    rows = np.arange(n)
+    duplicates = np.flatnonzero(rng.random(n) < duplicate_rate)
+    rows[duplicates] = rng.integers(0, n, len(duplicates))
+    return df.iloc[rows].reset_index(drop=True)
+
+# Function to append a batch of rows to a pipe-delimited file, writing the header first when header is set.
+# pyarrow's CSV writer is used when it is installed, as it is many times faster than to_csv.
+def write_batch(df, file_path, header):
+    if header:
+        with open(file_path, 'w') as file:
+            file.write('|'.join(df.columns) + '\n')
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        df.to_csv(file_path, sep='|', index=False, header=False, mode='a')
+        return
+    options = pa_csv.WriteOptions(include_header=False, delimiter='|', quoting_style='none')
+    with open(file_path, 'ab') as file:
+        pa_csv.write_csv(pa.Table.from_pandas(df, preserve_index=False), file, options)
+
+# Function to write a synthetic dataset of `rows` rows split over `files` pipe-delimited files with the Task 5 layout.
+# Returns the paths of the written files.
+def generate_files(output_dir, rows, files=1, duplicate_rate=0.01, anomaly_rates=None, seed=1):
+    anomaly_rates = {**default_anomaly_rates, **(anomaly_rates or {})}
+    rng = np.random.default_rng(seed)
+    pools = build_pools(rows, rng)
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Files written without one of the required columns
+    missing_columns = {
+        f: rng.choice(profile.required_columns)
+        for f in range(files) if rng.random() < anomaly_rates["Missing Columns"]
+    }
+
+    file_paths = []
+    first_row = 1
+    for f in range(files):
+        file_path = os.path.join(output_dir, f"part_{f:04d}.csv")
+        file_rows = rows // files + (1 if f < rows % files else 0)
+        for start in range(0, max(file_rows, 1), batch_size):
+            n = min(batch_size, file_rows - start)
+            df = generate_batch(first_row, n, pools, duplicate_rate, anomaly_rates, rng)
+            if f in missing_columns:
+                df = df.drop(columns=missing_columns[f])
+            write_batch(df, file_path, header=(start == 0))
+            first_row += n
+        file_paths.append(file_path)
+        print(f"Wrote {file_rows} rows to {file_path}")
+    return file_paths
+
+# Function to parse the --rate NAME=RATE arguments into a dict of anomaly rates
+def parse_rates(rates):
+    anomaly_rates = {}
+    for rate in rates:
+        name, _, value = rate.rpartition('=')
+        if name not in default_anomaly_rates:
+            raise ValueError(f"Unknown anomaly {name!r}; choose from: {', '.join(default_anomaly_rates)}")
+        anomaly_rates[name] = float(value)
+    return anomaly_rates
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic pipe-delimited source files with the layout Task 5 and Task 6 expect.")
+    parser.add_argument('--rows', type=int, default=1000000,
+                        help="Total number of rows, e.g. 1000000 to 100000000 (default: 1000000)")
+    parser.add_argument('--files', type=int, default=10,
+                        help="Number of files the rows are split over (default: 10)")
+    parser.add_argument('--output-dir', default="Synthetic_Data",
+                        help="Directory the files are written to (default: Synthetic_Data)")
+    parser.add_argument('--duplicate-rate', type=float, default=0.01,
+                        help="Fraction of rows that are exact duplicates of other rows (default: 0.01)")
+    parser.add_argument('--anomaly-rate', type=float, default=None,
+                        help="Injection rate of every row-level anomaly, overriding the defaults")
+    parser.add_argument('--rate', action='append', default=[], metavar='NAME=RATE',
+                        help="Injection rate of one anomaly, e.g. --rate 'Negative Profit Values=0.2'; can be repeated")
+    parser.add_argument('--seed', type=int, default=1,
+                        help="Seed of the random generator, so the same arguments always write the same files (default: 1)")
+    args = parser.parse_args()
+
+    anomaly_rates = {}
+    if args.anomaly_rate is not None:
+        anomaly_rates = {name: args.anomaly_rate for name in default_anomaly_rates if name != "Missing Columns"}
+    anomaly_rates.update(parse_rates(args.rate))
+
+    generate_files(args.output_dir, args.rows, args.files, args.duplicate_rate, anomaly_rates, args.seed)
+
+if __name__ == "__main__":
+    main()
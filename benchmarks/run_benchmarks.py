@@ -0,0 +1,189 @@
+import os
+import sys
+import json
+import time
+import shutil
+import zipfile
+import argparse
+import contextlib
+import platform
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+# Make the pipeline package importable when the script is run from any directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pipeline import cache, keys, extract, profile, cleanse, model, aggregates, export, report, metrics as run_metrics
+from generate_data import generate_files
+
+# Stages timed by the benchmark, in pipeline order
+stages = ['extract', 'profile', 'clean', 'dimensions', 'fact_join', 'aggregates', 'export', 'excel_report']
+
+# Metrics compared against the baseline
+compared_metrics = ['wall_seconds', 'peak_rss_mb']
+
+# Stage timings shorter than this many seconds are compared but never flagged, as they are mostly noise
+min_seconds = 1.0
+
+# Function to run one stage on the data of one size and measure it.
+# Each stage runs in a fresh worker process. The inputs it needs are read back from the stage cache of the earlier
+# stages before the clock starts, and the peak RSS is reset after that, so on Linux it is the peak of the stage alone.
+# Elsewhere it also includes the setup.
+# Returns the stage's metrics and the state the later stages need.
+def run_stage(stage, work_dir, state, chunk_size, export_format):
+    cache.cache_dir = os.path.join(work_dir, ".etl_cache")
+    keys.registry_dir = os.path.join(work_dir, ".key_registry")
+
+    # Inputs read from the cache, outside the timed section
+    if stage in ('profile', 'excel_report', 'clean'):
+        entries = state['entries']
+    if stage == 'excel_report':
+        results = profile.profile_files(entries)
+    if stage in ('export', 'fact_join', 'aggregates'):
+        data_marts = model.model_dimensions(state['cleansed'])
+
+    run_metrics.reset_peak_rss()
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    if stage == 'extract':
+        state = {'entries': extract.extract_files(state['data_dir'], chunk_size, full_refresh=True)}
+    elif stage == 'profile':
+        profile.profile_files(entries)
+    elif stage == 'clean':
+        state = {'cleansed': cleanse.cleanse(entries)}
+    elif stage == 'dimensions':
+        model.model_dimensions(state['cleansed'])
+    elif stage == 'fact_join':
+        # The keyed fact chunks are spooled so the export stage can be timed on its own
+        spool_dir = os.path.join(work_dir, "fact_spool")
+        shutil.rmtree(spool_dir, ignore_errors=True)
+        os.makedirs(spool_dir)
+        fact_stats = model.new_fact_stats()
+        spool_paths = []
+        for chunk in model.key_sales_fact(state['cleansed'], data_marts["Geography_Dimension"], fact_stats):
+            spool_paths.append(os.path.join(spool_dir, f"chunk{len(spool_paths)}.pkl"))
+            chunk.to_pickle(spool_paths[-1])
+        state = {'spool_paths': spool_paths, 'fact_rows': fact_stats['rows']}
+    elif stage == 'aggregates':
+        aggregates.build_aggregates(aggregates.aggregate_cube(state['cleansed']), data_marts)
+    elif stage == 'export':
+        output_dir = os.path.join(work_dir, "Data_Marts")
+        os.makedirs(output_dir, exist_ok=True)
+        zip_path = os.path.join(work_dir, "Data_Marts.zip")
+        with (zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) if export_format == 'csv' else contextlib.nullcontext()) as zipf:
+            for name, data_mart in data_marts.items():
+                export.export_mart(name, [data_mart], output_dir, export_format, 'snappy', zipf)
+            fact_chunks = (pd.read_pickle(spool_path) for spool_path in state['spool_paths'])
+            export.export_mart("Sales_Fact", fact_chunks, output_dir, export_format, 'snappy', zipf)
+    elif stage == 'excel_report':
+        report.write_report(results, os.path.join(work_dir, "Inconsistencies_Analysis.xlsx"))
+
+    metrics = {
+        'wall_seconds': round(time.perf_counter() - start_wall, 3),
+        'cpu_seconds': round(time.process_time() - start_cpu, 3),
+        'peak_rss_mb': run_metrics.peak_rss_mb(),
+    }
+    return metrics, state
+
+# Function to benchmark every stage on a dataset of `rows` rows, generating the dataset first if it does not exist
+def benchmark_size(rows, args):
+    size_dir = os.path.join(args.work_dir, f"rows_{rows}")
+    data_dir = os.path.join(size_dir, "data")
+    if not os.path.isdir(data_dir):
+        print(f"Generating {rows} rows in {data_dir}")
+        generate_files(data_dir, rows, args.files, seed=args.seed)
+
+    # Start from an empty cache and key registry so every stage does its full work
+    for state_dir in (".etl_cache", ".key_registry", "Data_Marts"):
+        shutil.rmtree(os.path.join(size_dir, state_dir), ignore_errors=True)
+
+    results = {}
+    state = {'data_dir': data_dir}
+    pipeline_state = {}
+    for stage in stages:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            metrics, state = executor.submit(run_stage, stage, size_dir, {**pipeline_state, **state}, args.chunk_size, args.export_format).result()
+        pipeline_state.update(state)
+        results[stage] = metrics
+        print(f"{rows:>12} rows  {stage:<13} {metrics['wall_seconds']:>9.2f} s wall  {metrics['cpu_seconds']:>9.2f} s CPU  "
+              f"{metrics['peak_rss_mb'] or 0:>9.1f} MB peak RSS")
+    return results
+
+# Function to compare the results against a baseline, printing the ratio of every metric.
+# Returns the list of regressions: metrics that grew by more than the tolerance.
+def compare_results(results, baseline, tolerance):
+    regressions = []
+    print(f"\nComparison with the baseline (regression threshold: +{tolerance:.0%})")
+    for size, size_results in results['sizes'].items():
+        for stage, metrics in size_results.items():
+            baseline_metrics = baseline.get('sizes', {}).get(size, {}).get(stage)
+            if baseline_metrics is None:
+                continue
+            for metric in compared_metrics:
+                current, previous = metrics.get(metric), baseline_metrics.get(metric)
+                if not current or not previous:
+                    continue
+                ratio = current / previous
+                too_short = metric == 'wall_seconds' and max(current, previous) < min_seconds
+                flag = "REGRESSION" if ratio > 1 + tolerance and not too_short else ""
+                print(f"{size:>12} rows  {stage:<13} {metric:<13} {previous:>10.2f} -> {current:>10.2f}  x{ratio:.2f}  {flag}")
+                if flag:
+                    regressions.append((size, stage, metric, ratio))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each stage of the ETL pipeline on synthetic data of several sizes.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000],
+                        help="Row counts to benchmark (default: 100000 1000000)")
+    parser.add_argument('--files', type=int, default=10,
+                        help="Number of files each dataset is split over (default: 10)")
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help="Chunk size passed to the extract stage (default: read whole files)")
+    parser.add_argument('--export-format', choices=['csv', 'parquet'], default='csv',
+                        help="Format of the export stage (default: csv)")
+    parser.add_argument('--seed', type=int, default=1,
+                        help="Seed of the data generator (default: 1)")
+    parser.add_argument('--work-dir', default=os.path.join("benchmarks", "work"),
+                        help="Directory for the generated data and the stage outputs; datasets are reused between runs (default: benchmarks/work)")
+    parser.add_argument('--output', default=os.path.join("benchmarks", "results.json"),
+                        help="JSON file the results are written to (default: benchmarks/results.json)")
+    parser.add_argument('--baseline', default=os.path.join("benchmarks", "baseline.json"),
+                        help="Baseline results to compare against, if the file exists (default: benchmarks/baseline.json)")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Relative increase of a metric over the baseline reported as a regression (default: 0.2)")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="Store these results as the new baseline")
+    args = parser.parse_args()
+
+    results = {
+        'environment': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'settings': {'files': args.files, 'chunk_size': args.chunk_size, 'export_format': args.export_format, 'seed': args.seed},
+        'sizes': {},
+    }
+    for rows in args.sizes:
+        results['sizes'][str(rows)] = benchmark_size(rows, args)
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f"\n{args.output} has been created successfully.")
+
+    if args.save_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        print(f"{args.baseline} has been saved as the new baseline.")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline.get('settings') != results['settings']:
+            print("Warning: the baseline was run with different settings; the comparison may not be meaningful")
+        regressions = compare_results(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metrics regressed beyond the tolerance.")
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+# Shared ETL pipeline of the Task 5 and Task 6 scripts.
+#
+# The stages run in this order, each one reading the previous stage's output from the cache in .etl_cache/:
+#   extract  - parse the pipe-delimited source files into chunks           (pipeline.extract)
+#   profile  - flag data-quality issues in each source file                (pipeline.profile)
+#   cleanse  - deduplicate, type and filter the extracted rows             (pipeline.cleanse)
+#   model    - build the dimension tables and key the fact table           (pipeline.model, pipeline.keys)
+#   export   - write the data marts, their statistics and the report       (pipeline.export, pipeline.report)
+#
+# Every stage output is content-addressed by the keys of its inputs and the stage's version (pipeline.cache),
+# so a stage that already ran on the same inputs, from either script, is not run again.
@@ -0,0 +1,95 @@
+import pandas as pd
+from . import cache, extract, model
+
+# Version of the aggregation logic. Bump it whenever the cube or the aggregate marts change so the cached partial
+# aggregates are rebuilt.
+version = "1"
+
+# Aggregate marts rolled up from the Sales_Fact, with the columns each is grouped by. Dashboards query these
+# instead of scanning the Sales_Fact; the statistics file lists their grains so a query can be routed to the
+# smallest one that answers it.
+aggregate_marts = {
+    "Sales_By_Month_Region": ['Order Month', 'Region'],
+    "Sales_By_Category": ['Category', 'Sub-Category'],
+    "Sales_By_Segment": ['Segment'],
+    "Sales_By_Ship_Mode_Lead_Time": ['Ship Mode', 'Lead Time Days'],
+    "Sales_By_Month_Region_Category_Segment": ['Order Month', 'Region', 'Category', 'Sub-Category', 'Segment'],
+}
+
+# Columns of the cube the partial aggregates are kept at; every aggregate mart is a roll-up of it
+cube_columns = ['Order Month', 'Region', 'Category', 'Sub-Category', 'Segment', 'Ship Mode', 'Lead Time Days']
+
+# Additive measures of the cube: the sums of the fact measures and the number of fact rows.
+# The average discount of a bucket is Discount / Rows.
+measure_columns = ['Sales', 'Quantity', 'Discount', 'Profit', 'Rows']
+
+# Decimals the summed measures are rounded to, so the backends' different summation orders give the same output
+measure_decimals = 4
+
+# Function to roll fact rows up to the cube: the month of the order as a yyyymm key (the Time dimension's
+# Date ID // 100), the region, category, sub-category, segment, ship mode and days from order to shipment,
+# with the sums of the measures of each bucket
+def cube_rows(df):
+    rows = pd.DataFrame({
+        'Order Month': model.date_key(df['Order Date']) // 100,
+        'Region': df['Region'].astype(extract.string_dtype()),
+        'Category': df['Category'].astype(extract.string_dtype()),
+        'Sub-Category': df['Sub-Category'].astype(extract.string_dtype()),
+        'Segment': df['Segment'].astype(extract.string_dtype()),
+        'Ship Mode': df['Ship Mode'].astype(extract.string_dtype()),
+        'Lead Time Days': (df['Ship Date'] - df['Order Date']).dt.days.astype('Int16'),
+        'Sales': df['Sales'].astype('float64'),
+        'Quantity': df['Quantity'].astype('Int64'),
+        'Discount': df['Discount'].astype('float64'),
+        'Profit': df['Profit'].astype('float64'),
+        'Rows': 1,
+    })
+    return merge_cubes([rows])
+
+# Function to merge cubes, or partial cubes, by summing the measures of their matching buckets
+def merge_cubes(cubes):
+    cube = pd.concat(cubes, ignore_index=True)
+    return cube.groupby(cube_columns, dropna=False, sort=False)[measure_columns].sum().reset_index()
+
+# Aggregate stage: roll the cleansed chunks up to the cube incrementally.
+# The partial cube of each chunk is cached under the content fingerprint of the chunk taken by the cleanse stage, so
+# when new data arrives only the chunks that are new or whose rows changed are aggregated again; the partial cubes
+# of the others are reused and the buckets are merged.
+def aggregate_cube(cleansed):
+    partials = []
+    keys_used = set()
+    aggregated = 0
+    for chunk_path, fingerprint in zip(cleansed['chunks'], cleansed['fingerprints']):
+        key = cache.stage_key('aggregates', version, [fingerprint])
+        partial = cache.load_stage('aggregates', key)
+        if partial is None:
+            partial = cube_rows(pd.read_pickle(chunk_path))
+            cache.save_stage('aggregates', key, partial)
+            aggregated += 1
+        partials.append(partial)
+        keys_used.add(key)
+    print(f"Aggregated {aggregated} new or changed chunks, reusing the partial aggregates of {len(partials) - aggregated}")
+    cache.prune_stage('aggregates', keep_keys=keys_used)
+    if not partials:
+        return pd.DataFrame(columns=cube_columns + measure_columns)
+    return merge_cubes(partials)
+
+# Function to build the aggregate marts from the cube. The dimension members are labelled with their IDs from the
+# dimension marts, so the aggregates join back to the star schema.
+def build_aggregates(cube, data_marts):
+    dimension_ids = {
+        'Region': data_marts["Region_Dimension"].rename(columns={'Region Name': 'Region'})[['Region', 'Region ID']],
+        'Category': data_marts["Product_Category_Dimension"][['Category', 'Category ID']],
+        'Sub-Category': data_marts["Product_Dimension"][['Sub-Category', 'Sub-Category ID']],
+        'Segment': data_marts["Segment_Dimension"].rename(columns={'Segment Name': 'Segment'})[['Segment', 'Segment ID']],
+    }
+    aggregates = {}
+    for name, columns in aggregate_marts.items():
+        aggregate = cube.groupby(columns, dropna=False)[measure_columns].sum().reset_index()
+        for col in columns:
+            if col in dimension_ids:
+                ids = dimension_ids[col].drop_duplicates(col).astype({col: extract.string_dtype()})
+                aggregate = aggregate.merge(ids, on=col, how='left')
+                aggregate.insert(aggregate.columns.get_loc(col), f"{col} ID", aggregate.pop(f"{col} ID").fillna(0).astype('int64'))
+        aggregates[name] = aggregate.round({col: measure_decimals for col in ['Sales', 'Discount', 'Profit']})
+    return aggregates
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+
+# Directory holding the source file manifest and the cached output of every pipeline stage
+cache_dir = ".etl_cache"
+
+# Function to get the cache directory of a stage, e.g. .etl_cache/extract
+def stage_root(stage):
+    return os.path.join(cache_dir, stage)
+
+# Function to compute the content hash of a file, read in blocks so large files are never loaded whole
+def file_hash(file_path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Function to get the cache file of a source file in a stage, named after a hash of its absolute path
+def cache_path(stage, file_path, suffix):
+    key = hashlib.sha1(os.path.abspath(file_path).encode()).hexdigest()[:16]
+    os.makedirs(stage_root(stage), exist_ok=True)
+    return os.path.join(stage_root(stage), key + suffix)
+
+# Function to load the manifest of the source files: path -> size, mtime, content hash, version and cached outputs.
+# With full_refresh the whole cache, including every stage output, is deleted and an empty manifest is returned.
+def load_manifest(full_refresh=False):
+    if full_refresh:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    manifest_path = os.path.join(cache_dir, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as file:
+        return json.load(file)
+
+# Function to save the manifest of the source files
+def save_manifest(manifest):
+    manifest_path = os.path.join(cache_dir, "manifest.json")
+    with open(manifest_path + ".tmp", 'w') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+# Function to look up the manifest entry of a source file.
+# Returns the entry if the file is unchanged and was cached with the same version, otherwise None.
+# A file whose mtime changed but whose content hash did not (e.g. a re-copied file) is still reused.
+def cached_entry(manifest, file_path, version):
+    entry = manifest.get(file_path)
+    if entry is None or entry['version'] != version:
+        return None
+    if not all(os.path.exists(path) for path in entry['outputs'].values()):
+        return None
+
+    stat = os.stat(file_path)
+    if stat.st_size != entry['size']:
+        return None
+    if stat.st_mtime != entry['mtime']:
+        if file_hash(file_path) != entry['hash']:
+            return None
+        entry['mtime'] = stat.st_mtime
+
+    return entry
+
+# Function to record the cached outputs of a freshly parsed source file, with any extra details about the file
+def record_outputs(manifest, file_path, version, outputs, **details):
+    if file_path in manifest:
+        for path in set(manifest[file_path]['outputs'].values()) - set(outputs.values()):
+            if os.path.exists(path):
+                os.remove(path)
+
+    stat = os.stat(file_path)
+    manifest[file_path] = {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'hash': file_hash(file_path),
+        'version': version,
+        'outputs': outputs,
+        **details,
+    }
+    return manifest[file_path]
+
+# Function to drop manifest entries (and their cached outputs) of source files that no longer exist.
+# Only entries of files in the scanned directories are dropped: the manifest is shared by the scripts, and the files of
+# a directory one of them does not read (e.g. the replayed quarantine rows Task 5 leaves out) are not gone.
+def prune_manifest(manifest, file_paths, scanned_dirs):
+    scanned_dirs = {os.path.abspath(scanned_dir) for scanned_dir in scanned_dirs}
+    for file_path in set(manifest) - set(file_paths):
+        if os.path.dirname(os.path.abspath(file_path)) not in scanned_dirs:
+            continue
+        for path in manifest.pop(file_path)['outputs'].values():
+            if os.path.exists(path):
+                os.remove(path)
+
+# Function to compute the content address of a stage output from the stage name, its configuration and the keys
+# of its inputs. The same inputs processed with the same configuration always get the same key, whichever script runs the stage.
+def stage_key(stage, config, input_keys):
+    payload = json.dumps({'stage': stage, 'config': config, 'inputs': input_keys}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+# Function to get the directory of a stage output, where the stage writes any files that belong to it
+def stage_output_dir(stage, key):
+    output_dir = os.path.join(stage_root(stage), key)
+    os.makedirs(output_dir, exist_ok=True)
+    return output_dir
+
+# Function to load a cached stage output, or None if the stage has not completed for this key
+def load_stage(stage, key):
+    result_path = os.path.join(stage_root(stage), key, "result.pkl")
+    if not os.path.exists(result_path):
+        return None
+    # Touch the output so pruning keeps the most recently used ones
+    os.utime(os.path.join(stage_root(stage), key))
+    with open(result_path, 'rb') as file:
+        return pickle.load(file)
+
+# Function to save a stage output. The result is written last, so an interrupted stage is never mistaken for a complete one.
+def save_stage(stage, key, result):
+    result_path = os.path.join(stage_output_dir(stage, key), "result.pkl")
+    with open(result_path + ".tmp", 'wb') as file:
+        pickle.dump(result, file)
+    os.replace(result_path + ".tmp", result_path)
+
+# Function to delete the outputs of a stage except the ones in keep_keys and the keep_recent most recently used
+def prune_stage(stage, keep_keys=(), keep_recent=0):
+    root = stage_root(stage)
+    if not os.path.isdir(root):
+        return
+    output_dirs = [name for name in os.listdir(root) if os.path.isdir(os.path.join(root, name))]
+    output_dirs.sort(key=lambda name: os.path.getmtime(os.path.join(root, name)), reverse=True)
+    for name in output_dirs[keep_recent:]:
+        if name not in keep_keys:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
@@ -0,0 +1,288 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+from . import cache, extract
+
+# Version of the cleansing logic. Bump it whenever clean_data changes so the cached cleansed data is rebuilt.
+version = "7"
+
+# Number of cleansed datasets whose files are kept in the cache, so runs over different inputs (e.g. Task 5 and
+# Task 6 with different chunk sizes) do not keep evicting each other
+keep_recent = 2
+
+# Default directory of the quarantine dataset of rejected rows
+default_quarantine_dir = "Quarantine"
+
+# File of a quarantine directory listing the parts the pipeline wrote there, in order, with their content hashes.
+# Parquet readers skip files starting with an underscore, so the directory can still be read as one dataset.
+quarantine_manifest = "_manifest.json"
+
+# Default directory replayed quarantine rows are written to as source files (see replay_quarantine)
+default_replay_dir = "Quarantine_Replay"
+
+# Cleansing rules in the order rows are reported under them: the name of each rule and a function returning, for every
+# row of a chunk, whether the row breaks it. Rule i sets bit i + 1 of a row's reason code; bit 0 marks duplicate rows.
+# Data types are already correct: the schema is applied at extraction.
+cleanse_rules = [
+    # Rows with missing essential fields
+    ("Missing Required Values", lambda df: df[['Order ID', 'Product ID', 'Customer ID', 'Order Date', 'Sales']].isna().any(axis=1)),
+    # Records with zero sales and zero quantity (a missing quantity is not zero)
+    ("Zero Sales and Quantity", lambda df: ((df['Sales'] == 0) & (df['Quantity'] == 0)).fillna(False)),
+    # Records where the ship date is before the order date
+    ("Mismatched Order and Ship Dates", lambda df: df['Ship Date'] < df['Order Date']),
+    # Records with negative (or missing) profit values
+    ("Negative Profit Values", lambda df: ~(df['Profit'] >= 0)),
+    # Records with invalid postal codes (assuming US postal codes here for simplicity)
+    ("Invalid Postal Codes", lambda df: ~df['Postal Code'].str.match(r'^\d{5}(-\d{4})?$', na=False)),
+]
+
+# Names of the bits of a reason code, lowest bit first
+reason_names = ["Duplicate Rows"] + [name for name, _ in cleanse_rules]
+
+# Function to get the names of the reasons set in a reason code, joined by "; "
+def reason_text(code):
+    return "; ".join(name for bit, name in enumerate(reason_names) if code & (1 << bit))
+
+# Function to create the duplicate check's record of the rows seen so far: the 64-bit hashes of the distinct rows,
+# 8 bytes per row, kept as a few sorted arrays whose sizes halve from the first to the last
+def new_seen_rows():
+    return []
+
+# Function to find which of the given row hashes were seen before, by binary search in each sorted array
+def seen_before(seen_rows, hashes):
+    found = np.zeros(len(hashes), dtype=bool)
+    for seen in seen_rows:
+        positions = np.searchsorted(seen, hashes).clip(max=len(seen) - 1)
+        found |= seen[positions] == hashes
+    return found
+
+# Function to add the hashes of new distinct rows to the rows seen so far. They are added as a sorted array that is
+# merged with the last arrays while it is at least as large, like a binary counter, so there are only about log2(rows)
+# arrays to search and every hash is merged about log2(rows) times; a stable sort merges two sorted arrays in linear time.
+def add_seen(seen_rows, hashes):
+    if not len(hashes):
+        return
+    seen_rows.append(np.sort(hashes))
+    while len(seen_rows) > 1 and len(seen_rows[-1]) >= len(seen_rows[-2]):
+        last = seen_rows.pop()
+        seen_rows[-1] = np.sort(np.concatenate([seen_rows[-1], last]), kind='stable')
+
+# Function to check every row of a chunk against all cleansing rules in one pass, returning the reason code of each
+# row (0 for rows that are kept) and the hash of each row.
+# seen_rows holds the hashes of rows seen in earlier chunks (see new_seen_rows); the chunk's new rows are added to it.
+def reason_codes(df, seen_rows):
+    row_hashes = pd.util.hash_pandas_object(df, index=False)
+    hashes = row_hashes.to_numpy()
+    is_new = ~row_hashes.duplicated().to_numpy() & ~seen_before(seen_rows, hashes)
+    add_seen(seen_rows, hashes[is_new])
+
+    codes = np.where(is_new, 0, 1).astype(np.uint8)
+    for bit, (_, broken) in enumerate(cleanse_rules, start=1):
+        codes |= np.where(broken(df).to_numpy(dtype=bool), 1 << bit, 0).astype(np.uint8)
+    return codes, row_hashes
+
+# Data Cleansing Function.
+# All rules are evaluated in one pass into a reason code per row (see reason_codes), and the kept rows are copied once.
+# Each dropped row is counted in dropped under the first reason it was dropped for, duplicates first.
+# Returns the cleaned rows, the rejected rows with the raw strings of their values that did not fit their type (looked
+# up by row in raw, see extract.parse_file), their reason code, reasons and source file, a fingerprint of the cleaned
+# rows' content taken from their row hashes, which changes whenever any cleaned row does, and the hashes of the rows
+# that were not duplicates.
+def clean_data(df, seen_rows, dropped, source_file=None, raw=None):
+    codes, row_hashes = reason_codes(df, seen_rows)
+
+    for bit, name in enumerate(reason_names):
+        first_reason = (codes & ((2 << bit) - 1)) == (1 << bit)
+        dropped[name] = dropped.get(name, 0) + int(first_reason.sum())
+
+    kept = codes == 0
+    # Fill missing Customer Name values on the kept rows only, so the rejected rows are quarantined as they were read
+    cleaned_data = df[kept]
+    cleaned_data = cleaned_data.assign(**{'Customer Name': cleaned_data['Customer Name'].fillna('Unknown')})
+
+    rejected = df[~kept]
+    rejected_codes = pd.Series(codes[~kept], index=rejected.index)
+    raw = raw.reindex(rejected.index) if raw is not None else pd.DataFrame(index=rejected.index)
+    rejected = rejected.assign(**{
+        **{f"Raw {col}": raw[col] if col in raw.columns else None for col in extract.coercible_columns},
+        'Source File': source_file,
+        'Reason Code': rejected_codes,
+        'Reasons': rejected_codes.map({code: reason_text(code) for code in rejected_codes.unique()}),
+    })
+    hashes = row_hashes.to_numpy()
+    fingerprint = hashlib.sha256(hashes[kept].tobytes()).hexdigest()[:32]
+    return cleaned_data, rejected, fingerprint, hashes[(codes & 1) == 0]
+
+# Function to write rejected rows to a Parquet part of the quarantine dataset.
+# Categorical and raw value columns are written as plain strings, so the parts of all chunks share one schema.
+def write_quarantine_part(rejected, path):
+    strings = {col: extract.string_dtype() for col in rejected.columns
+               if isinstance(rejected[col].dtype, pd.CategoricalDtype) or col.startswith("Raw ")}
+    rejected.astype(strings).to_parquet(path, index=False)
+
+# Function to cleanse the extracted chunks of one file into the stage output directory of file_key.
+# seen_rows holds the hashes of the rows of the files before it and gets the hashes of its rows.
+# Returns the paths and content fingerprints of the cleansed chunks, the paths of the quarantine parts, the path of
+# the hashes of the file's rows that were not duplicates, the row counts in and out and the rows dropped per step.
+def cleanse_file(entry, seen_rows, file_key):
+    output_dir = cache.stage_output_dir('cleanse', file_key)
+    result = {'chunks': [], 'fingerprints': [], 'quarantine': [], 'rows_in': 0, 'rows_out': 0, 'dropped': {}}
+    new_hashes = []
+    raw = pd.read_pickle(entry['raw']) if entry.get('raw') else None
+    for chunk_path in entry['chunks']:
+        chunk = pd.read_pickle(chunk_path)
+        cleaned_data, rejected, fingerprint, hashes = clean_data(chunk, seen_rows, result['dropped'], entry['file'], raw)
+        result['rows_in'] += len(chunk)
+        result['rows_out'] += len(cleaned_data)
+        result['chunks'].append(os.path.join(output_dir, f"chunk{len(result['chunks'])}.pkl"))
+        cleaned_data.to_pickle(result['chunks'][-1])
+        result['fingerprints'].append(fingerprint)
+        if len(rejected):
+            result['quarantine'].append(os.path.join(output_dir, f"quarantine{len(result['quarantine'])}.parquet"))
+            write_quarantine_part(rejected, result['quarantine'][-1])
+        new_hashes.append(hashes)
+    result['hashes'] = os.path.join(output_dir, "hashes.npy")
+    np.save(result['hashes'], np.sort(np.concatenate(new_hashes)) if new_hashes else np.empty(0, dtype=np.uint64))
+    return result
+
+# Cleanse stage: cleanse the extracted chunks of all files, in file order, into cached cleansed chunks.
+# The rejected rows of each chunk are written next to them as a part of the quarantine dataset (see export_quarantine).
+# Each file's output is cached under the key of its extracted chunks and the key of the file before it, which stands
+# for the duplicate check's state: the rows of all earlier files. A new file at the end of the file order is the only
+# one cleansed again; the duplicate check's state for it is rebuilt from the row hashes saved with the earlier files.
+# The output is content-addressed, so any script that extracts the same files finds the cleansed data already
+# produced by another and reuses it.
+# Returns the stage key, the paths and content fingerprints of the cleansed chunks, the paths of the quarantine parts,
+# the row counts in and out and the rows dropped per step.
+def cleanse(entries):
+    seen_rows = None
+    file_key = None
+    file_results = []
+    cleansed_files = 0
+    for entry in entries:
+        file_key = cache.stage_key('cleanse', version, [file_key, entry['key']])
+        result = cache.load_stage('cleanse', file_key)
+        if result is None:
+            if seen_rows is None:
+                seen_rows = new_seen_rows()
+                for earlier in file_results:
+                    add_seen(seen_rows, np.load(earlier['hashes']))
+            result = cleanse_file(entry, seen_rows, file_key)
+            cache.save_stage('cleanse', file_key, result)
+            cleansed_files += 1
+        elif seen_rows is not None:
+            add_seen(seen_rows, np.load(result['hashes']))
+        file_results.append({**result, 'key': file_key})
+    if cleansed_files < len(entries):
+        print(f"Reusing the cached cleansed data of {len(entries) - cleansed_files} files, cleansing {cleansed_files} files")
+    cache.prune_stage('cleanse', keep_keys={result['key'] for result in file_results}, keep_recent=keep_recent * len(entries))
+
+    dropped = {}
+    for result in file_results:
+        for reason, count in result['dropped'].items():
+            dropped[reason] = dropped.get(reason, 0) + count
+    return {
+        'key': cache.stage_key('cleanse', version, [entry['key'] for entry in entries]),
+        'chunks': [path for result in file_results for path in result['chunks']],
+        'fingerprints': [fingerprint for result in file_results for fingerprint in result['fingerprints']],
+        'quarantine': [path for result in file_results for path in result['quarantine']],
+        'rows_in': sum(result['rows_in'] for result in file_results),
+        'rows_out': sum(result['rows_out'] for result in file_results),
+        'dropped': dropped,
+        'cached': cleansed_files == 0,
+    }
+
+# Function to load the manifest of the quarantine dataset in quarantine_dir: part name -> content hash of every part
+# the pipeline wrote there. It is empty when the pipeline has not written a quarantine there.
+def load_quarantine_manifest(quarantine_dir):
+    manifest_path = os.path.join(quarantine_dir, quarantine_manifest)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as file:
+        return json.load(file)
+
+# Function to save the manifest of the quarantine dataset in quarantine_dir
+def save_quarantine_manifest(quarantine_dir, parts):
+    manifest_path = os.path.join(quarantine_dir, quarantine_manifest)
+    with open(manifest_path + ".tmp", 'w') as file:
+        json.dump(parts, file, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+# Function to list the parts of the quarantine dataset in quarantine_dir in part number order
+def quarantine_parts(quarantine_dir):
+    if not os.path.isdir(quarantine_dir):
+        return []
+    names = [name for name in os.listdir(quarantine_dir) if re.fullmatch(r'part\d+\.parquet', name)]
+    return sorted(names, key=lambda name: int(name[4:-len(".parquet")]))
+
+# Function to export the quarantine of a cleanse stage result as a Parquet dataset in quarantine_dir. It holds every
+# rejected row with its source columns, the file it came from, its reason code (a bitmask of reason_names) and the
+# names of its reasons, so the counts of the dropped rows can be reconciled with the source files and the rows can be
+# replayed once fixed (see replay_quarantine).
+# Only the parts listed in the directory's manifest, which the pipeline wrote itself, are replaced. The directory is
+# left as it is when it holds other Parquet files, or when a part was changed or removed since it was written, so
+# fixes to the rows that were not replayed yet are never overwritten.
+def export_quarantine(cleansed, quarantine_dir):
+    parts = load_quarantine_manifest(quarantine_dir)
+    if os.path.isdir(quarantine_dir):
+        unknown = sorted(name for name in os.listdir(quarantine_dir) if name.endswith(".parquet") and name not in parts)
+        if unknown:
+            print(f"Warning: {quarantine_dir} holds Parquet files the pipeline did not write ({', '.join(unknown[:5])}), so the "
+                  f"quarantine was not written. Remove them or choose another --quarantine-dir.")
+            return
+    edited = [name for name, part_hash in parts.items()
+              if not os.path.exists(os.path.join(quarantine_dir, name)) or cache.file_hash(os.path.join(quarantine_dir, name)) != part_hash]
+    if edited:
+        print(f"Warning: {quarantine_dir} was changed since it was written ({', '.join(edited[:5])} changed or removed), "
+              f"so the quarantine was not rewritten and the changes are kept. Replay the fixed "
+              f"rows with Task_6_script.py --replay-quarantine, or remove {quarantine_dir} to discard the changes.")
+        return
+
+    for name in parts:
+        os.remove(os.path.join(quarantine_dir, name))
+    os.makedirs(quarantine_dir, exist_ok=True)
+    parts = {}
+    for i, part_path in enumerate(cleansed['quarantine']):
+        name = f"part{i:05d}.parquet"
+        shutil.copyfile(part_path, os.path.join(quarantine_dir, name))
+        parts[name] = cache.file_hash(part_path)
+    save_quarantine_manifest(quarantine_dir, parts)
+    print(f"{quarantine_dir} has been created successfully ({cleansed['rows_in'] - cleansed['rows_out']} rejected rows).")
+
+# Function to replay the quarantine dataset in quarantine_dir after its rows were fixed.
+# The quarantined rows that now pass every rule are written to file_path as a pipe-delimited source file, so the next
+# extraction that reads its directory loads them like any other file; rows that still break a rule, and duplicates,
+# are left out. Replayed rows get the negated Row ID of the row they fix, so they never clash with a source row's ID
+# and still point back to it. The parts are then recorded in the manifest as they are now, so the fixes count as
+# replayed and the next export_quarantine replaces them. Use a new file_path for every replay, as the next run
+# quarantines the original rows again and a later replay would not have the fixes.
+# Returns the number of rows written.
+def replay_quarantine(quarantine_dir, file_path):
+    names = quarantine_parts(quarantine_dir)
+    if not names:
+        print(f"There are no quarantined rows to replay in {quarantine_dir}")
+        return 0
+
+    rejected = extract.concat_chunks(pd.read_parquet(os.path.join(quarantine_dir, name)) for name in names)
+    # Duplicates repeat a row that was kept or is quarantined itself, so replaying them would only duplicate it again
+    rejected = rejected.loc[(rejected['Reason Code'] & 1) == 0, extract.source_columns]
+    codes, _ = reason_codes(rejected, new_seen_rows())
+    fixed = rejected[codes == 0]
+    if fixed.empty:
+        print(f"None of the {len(rejected)} quarantined rows that are not duplicates passes the cleansing rules yet")
+        return 0
+    fixed = fixed.assign(**{'Row ID': -fixed['Row ID'].abs()})
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    fixed.to_csv(file_path, sep='|', index=False, date_format=extract.date_format)
+    save_quarantine_manifest(quarantine_dir, {name: cache.file_hash(os.path.join(quarantine_dir, name)) for name in names})
+    print(f"Replayed {len(fixed)} of {len(rejected)} quarantined rows that are not duplicates into {file_path}")
+    return len(fixed)
+
+# Function to stream the cleansed chunks of a cleanse stage result
+def cleansed_chunks(cleansed):
+    for chunk_path in cleansed['chunks']:
+        yield pd.read_pickle(chunk_path)
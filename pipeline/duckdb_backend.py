@@ -0,0 +1,259 @@
+import os
+import re
+import shutil
+import duckdb
+import numpy as np
+import pandas as pd
+from . import aggregates, cache, cleanse as pandas_cleanse, extract, keys, model
+
+# DuckDB backend of the cleanse and model stages, selected with --backend duckdb.
+# The source files are scanned directly by DuckDB and the cleansing, the dimensions and the fact join run as SQL queries
+# on all cores, spilling to disk when the data does not fit in memory. Only the dimensions, which are small, and the
+# Sales_Fact chunks being exported are brought into pandas. The output matches the pandas backend row for row: the same
+# rows in the same order with the same dtypes, and the same IDs from the key registry.
+
+# Values pandas reads as missing by default, so the files are parsed into the same missing values
+na_values = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+]
+
+# SQL types of the numeric columns of the declared schema
+sql_types = {'Int32': 'INTEGER', 'Int16': 'SMALLINT', 'float32': 'FLOAT', 'float64': 'DOUBLE'}
+
+# The rules of cleanse.cleanse_rules as SQL conditions a row must meet to be kept, in the same order, so a rejected row
+# gets the same reason code. Duplicate rows are removed first, as in clean_data.
+cleanse_checks = [
+    ("Missing Required Values", "\"Order ID\" IS NOT NULL AND \"Product ID\" IS NOT NULL AND \"Customer ID\" IS NOT NULL "
+                                "AND \"Order Date\" IS NOT NULL AND \"Sales\" IS NOT NULL"),
+    ("Zero Sales and Quantity", "NOT COALESCE(\"Sales\" = 0 AND \"Quantity\" = 0, false)"),
+    ("Mismatched Order and Ship Dates", "NOT COALESCE(\"Ship Date\" < \"Order Date\", false)"),
+    ("Negative Profit Values", "COALESCE(\"Profit\" >= 0, false)"),
+    ("Invalid Postal Codes", "COALESCE(regexp_full_match(\"Postal Code\", '\\d{5}(-\\d{4})?'), false)"),
+]
+
+# Function to quote a column name for SQL
+def quote(col):
+    return '"' + col.replace('"', '""') + '"'
+
+# Function to quote a string literal for SQL
+def sql_string(value):
+    return "'" + value.replace("'", "''") + "'"
+
+# Pattern of the strings pandas parses with each strptime directive of the date formats; DuckDB's strptime is more lenient
+format_patterns = {'%m': '\\d{1,2}', '%d': '\\d{1,2}', '%Y': '\\d{4}', '%y': '\\d{2}'}
+
+# Function to get the SQL expression parsing a column of date strings with a format, like extract.parse_dates.
+# Dates outside the range of datetime64[ns] become NULL.
+def parse_date(value, date_format):
+    pattern = "".join(format_patterns.get(part, re.escape(part)) for part in re.split(r'(%[a-zA-Z])', date_format) if part)
+    low, high = pd.Timestamp.min.ceil('D'), pd.Timestamp.max.floor('D')
+    parsed = f"try_strptime({value}, '{date_format}')"
+    return (f"CASE WHEN regexp_full_match({value}, '{pattern}') AND {parsed} BETWEEN TIMESTAMP '{low}' AND TIMESTAMP '{high}' "
+            f"THEN {parsed} END")
+
+# Function to get the SQL expression applying the declared schema to a column read as strings, like apply_schema.
+# Values that do not fit their type become NULL. Dates are parsed with the format detected for their file in
+# date_formats (file path -> column -> format), as the pandas backend does.
+def typed_column(col, dtype, date_formats):
+    value = quote(col)
+    if dtype == 'datetime64[ns]':
+        file_formats = {file_path: formats.get(col, extract.date_format) for file_path, formats in date_formats.items()}
+        if len(set(file_formats.values())) <= 1:
+            return parse_date(value, next(iter(file_formats.values()), extract.date_format))
+        cases = " ".join(f"WHEN {sql_string(file_path)} THEN {parse_date(value, col_format)}" for file_path, col_format in file_formats.items())
+        return f"CASE filename {cases} END"
+    if pd.api.types.is_numeric_dtype(dtype):
+        # pd.to_numeric does not accept digit separators, which DuckDB does
+        number = f"CASE WHEN NOT contains({value}, '_') THEN TRY_CAST({value} AS DOUBLE) END"
+        sql_type = sql_types[str(dtype)]
+        if pd.api.types.is_integer_dtype(dtype):
+            limits = np.iinfo(dtype.numpy_dtype)
+            return f"CASE WHEN ({number}) % 1 = 0 AND ({number}) BETWEEN {limits.min} AND {limits.max} THEN CAST({number} AS {sql_type}) END"
+        return f"CAST({number} AS {sql_type})"
+    return value
+
+# Function to give a frame fetched from DuckDB the dtypes of the declared schema, so it matches the pandas backend
+def apply_dtypes(df):
+    for col in df.columns:
+        dtype = extract.schema.get(col)
+        if dtype == 'category':
+            df[col] = df[col].astype(extract.string_dtype()).astype('category')
+        elif dtype is not None:
+            df[col] = df[col].astype(dtype)
+    return df
+
+# Function to open a DuckDB connection using all cores, spilling to the cache directory when memory_limit
+# (e.g. "4GB"; default 80% of RAM) is reached. Insertion order is preserved, as the row order decides which
+# duplicate is kept and the order in which dimension members get their IDs.
+def connect(memory_limit=None):
+    config = {'preserve_insertion_order': True, 'temp_directory': cache.stage_root('duckdb')}
+    if memory_limit:
+        config['memory_limit'] = memory_limit
+    return duckdb.connect(config=config)
+
+# Columns of the raw strings of the values that did not fit their type, kept with the rejected rows
+raw_columns = [f"Raw {col}" for col in extract.coercible_columns]
+
+# Function to write the rejected rows to Parquet parts of the quarantine dataset, like cleanse.cleanse, in chunks of
+# about chunk_size rows in the order they were read. Returns the paths of the parts.
+def write_quarantine(con, chunk_size):
+    quarantine_dir = os.path.join(cache.stage_root('duckdb'), "quarantine")
+    shutil.rmtree(quarantine_dir, ignore_errors=True)
+    os.makedirs(quarantine_dir)
+    columns = ", ".join(quote(col) for col in extract.source_columns + raw_columns)
+    cursor = con.execute(f"""
+        SELECT {columns}, source_file AS "Source File", reason_code AS "Reason Code"
+        FROM checked WHERE reason IS NOT NULL ORDER BY row_id
+    """)
+    part_paths = []
+    while True:
+        rejected = cursor.fetch_df_chunk(max(1, (chunk_size or 1000000) // 2048))
+        if rejected.empty:
+            break
+        rejected = apply_dtypes(rejected)
+        rejected['Reasons'] = rejected['Reason Code'].map({code: pandas_cleanse.reason_text(code) for code in rejected['Reason Code'].unique()})
+        part_paths.append(os.path.join(quarantine_dir, f"quarantine{len(part_paths)}.parquet"))
+        pandas_cleanse.write_quarantine_part(rejected, part_paths[-1])
+    return part_paths
+
+# Extract and cleanse stages: scan the source files into a typed table and cleanse it, like cleanse.cleanse.
+# Each row is checked against cleanse_checks in one pass into a reason code with the bits of cleanse.reason_names;
+# rows repeating an earlier row are duplicates, and the first failed check or duplication is a row's drop reason.
+# Returns the connection holding the cleansed view, the paths of the quarantine parts, the values of each column that
+# did not fit its type, the row counts in and out, the rows dropped per step and the chunk_size the Sales_Fact is fetched in,
+# or None when there are no source files. The replayed quarantine rows in replay_dir are read after the source files.
+def cleanse(data_dir, chunk_size=None, memory_limit=None, replay_dir=None):
+    # Files pandas cannot read are skipped with the same message as extract.parse_file, so both backends load the same files
+    date_formats = {}
+    for file_path in extract.source_files(data_dir, replay_dir):
+        try:
+            date_formats[file_path] = extract.detect_date_formats(extract.read_sample(file_path), file_path)
+        except Exception as e:
+            print(f"Error reading {file_path}: {e}")
+    file_paths = list(date_formats)
+    if not file_paths:
+        return None
+    con = connect(memory_limit)
+    # Short rows are padded with NULLs, as pandas does. The parallel scanner cannot pad files with newlines in quoted
+    # fields, so the files are scanned one thread per file.
+    scan = (f"read_csv({file_paths!r}, delim='|', header=true, all_varchar=true, union_by_name=true, "
+            f"null_padding=true, parallel=false, nullstr={na_values!r}, filename=true)")
+    file_columns = set(con.execute(f"DESCRIBE SELECT * FROM {scan}").df()['column_name'])
+    typed = ", ".join(
+        f"{typed_column(col, dtype, date_formats) if col in file_columns else 'NULL'} AS {quote(col)}"
+        for col, dtype in extract.schema.items()
+    )
+    # Raw strings of the values that did not fit their type and became NULL, like the raw values kept by apply_schema
+    raw = ", ".join(
+        f"CASE WHEN ({typed_column(col, extract.schema[col], date_formats)}) IS NULL THEN {quote(col)} END AS {quote('Raw ' + col)}"
+        if col in file_columns else f"CAST(NULL AS VARCHAR) AS {quote('Raw ' + col)}"
+        for col in extract.coercible_columns
+    )
+    columns = ", ".join(quote(col) for col in extract.source_columns)
+    con.execute(f"CREATE TABLE source AS SELECT {typed}, {raw}, parse_filename(filename) AS source_file FROM {scan}")
+    print(f"Scanned {len(file_paths)} files with DuckDB")
+
+    counts = ", ".join(f"count({quote(col)})" for col in raw_columns)
+    coerced = {}
+    paths_by_name = {os.path.basename(file_path): file_path for file_path in file_paths}
+    for file_name, *file_counts in con.execute(f"SELECT source_file, {counts} FROM source GROUP BY source_file ORDER BY source_file").fetchall():
+        file_coerced = {col: count for col, count in zip(extract.coercible_columns, file_counts) if count}
+        extract.report_coerced(paths_by_name[file_name], file_coerced)
+        for col, count in file_coerced.items():
+            coerced[col] = coerced.get(col, 0) + count
+
+    # Each row is a duplicate unless it is the first occurrence (the position) of its values
+    duplicate = "row_id <> position"
+    reasons = " ".join(f"WHEN NOT ({condition}) THEN '{reason}'" for reason, condition in cleanse_checks)
+    bits = " + ".join(f"CASE WHEN NOT ({condition}) THEN {1 << pandas_cleanse.reason_names.index(reason)} ELSE 0 END"
+                      for reason, condition in cleanse_checks)
+    con.execute(f"""
+        CREATE TABLE checked AS
+        SELECT *, CASE WHEN {duplicate} THEN 'Duplicate Rows' {reasons} END AS reason,
+               CAST(CASE WHEN {duplicate} THEN 1 ELSE 0 END + {bits} AS UTINYINT) AS reason_code
+        FROM (SELECT rowid AS row_id, min(rowid) OVER (PARTITION BY {columns}) AS position, * FROM source)
+    """)
+    con.execute("DROP TABLE source")
+    con.execute(f"""
+        CREATE VIEW cleansed AS
+        SELECT position, * EXCLUDE (row_id, position, source_file, reason, reason_code, "Customer Name", {", ".join(quote(col) for col in raw_columns)}),
+               COALESCE("Customer Name", 'Unknown') AS "Customer Name"
+        FROM checked WHERE reason IS NULL
+    """)
+
+    rows_in = con.execute("SELECT count(*) FROM checked").fetchone()[0]
+    counts = dict(con.execute("SELECT reason, count(*) FROM checked WHERE reason IS NOT NULL GROUP BY reason").fetchall())
+    dropped = {reason: counts.get(reason, 0) for reason in pandas_cleanse.reason_names}
+    rows_out = rows_in - sum(counts.values())
+    quarantine_paths = write_quarantine(con, chunk_size)
+    return {'connection': con, 'chunk_size': chunk_size, 'quarantine': quarantine_paths, 'coerced': coerced,
+            'rows_in': rows_in, 'rows_out': rows_out, 'dropped': dropped, 'cached': False}
+
+# Model stage: build the dimension tables from the cleansed view, like model.model_dimensions.
+# The distinct rows of each dimension are taken in order of first appearance and get their IDs from the key registry;
+# the calendar covers the date range of the cleansed data.
+def model_dimensions(cleansed):
+    con = cleansed['connection']
+    dimensions = {}
+    for name, columns in model.dimension_columns.items():
+        column_list = ", ".join(quote(col) for col in columns)
+        rows = con.execute(f"SELECT {column_list} FROM cleansed GROUP BY {column_list} ORDER BY min(position)").df()
+        dimensions[name] = apply_dtypes(rows)
+    first, last = con.execute(
+        "SELECT least(min(\"Order Date\"), min(\"Ship Date\")), greatest(max(\"Order Date\"), max(\"Ship Date\")) FROM cleansed"
+    ).fetchone()
+    dimensions['date_range'] = pd.Series({'min': pd.Timestamp(first), 'max': pd.Timestamp(last)})
+
+    registry = keys.load_registry()
+    data_marts = model.build_dimensions(dimensions, registry)
+    keys.save_registry(registry)
+    return data_marts
+
+# Function to join the Geography IDs to the cleansed view, like model.key_sales_fact, yielding Sales_Fact chunks of
+# about chunk_size rows (1M by default) in the order of the cleansed data. The date keys are computed from the dates
+# by model.sales_fact_chunk, as in the pandas backend. The statistics are collected in fact_stats.
+def key_sales_fact(cleansed, geography_dim, fact_stats):
+    con = cleansed['connection']
+    columns = model.geography_key
+    con.register('geography_index', geography_dim[columns + ['Geography ID']].drop_duplicates(columns))
+    geography_join = " AND ".join(f"c.{quote(col)} IS NOT DISTINCT FROM geography_index.{quote(col)}" for col in columns)
+    fact_list = ", ".join(f"c.{quote(col)}" for col in model.fact_columns)
+    cursor = con.execute(f"""
+        SELECT {fact_list}, COALESCE(geography_index."Geography ID", 0) AS "Geography ID"
+        FROM cleansed c
+        LEFT JOIN geography_index ON {geography_join}
+        ORDER BY c.position
+    """)
+
+    # DuckDB returns results in vectors of 2048 rows
+    vectors = max(1, (cleansed['chunk_size'] or 1000000) // 2048)
+    while True:
+        sales_fact = cursor.fetch_df_chunk(vectors)
+        if sales_fact.empty:
+            break
+        sales_fact = apply_dtypes(sales_fact)
+        misses = int((sales_fact['Geography ID'] == 0).sum())
+        if misses:
+            print(f"Warning: {misses} rows have no match in the Geography dimension")
+        sales_fact = model.sales_fact_chunk(sales_fact, sales_fact['Geography ID'].to_numpy())
+
+        model.update_fact_stats(fact_stats, sales_fact)
+        yield sales_fact
+
+# Function to roll the cleansed view up to the cube of the aggregate marts, like aggregates.aggregate_cube.
+# DuckDB aggregates all rows in one query on all cores, so nothing is cached between runs.
+def aggregate_cube(cleansed):
+    con = cleansed['connection']
+    cube = con.execute("""
+        SELECT CAST(year("Order Date") * 100 + month("Order Date") AS INTEGER) AS "Order Month",
+               "Region", "Category", "Sub-Category", "Segment", "Ship Mode",
+               date_diff('day', "Order Date", "Ship Date") AS "Lead Time Days",
+               sum("Sales") AS "Sales", CAST(sum("Quantity") AS BIGINT) AS "Quantity",
+               sum(CAST("Discount" AS DOUBLE)) AS "Discount", sum("Profit") AS "Profit", count(*) AS "Rows"
+        FROM cleansed
+        GROUP BY ALL
+    """).df()
+    labels = ['Region', 'Category', 'Sub-Category', 'Segment', 'Ship Mode']
+    return cube.astype({'Lead Time Days': 'Int16', 'Quantity': 'Int64', **{col: extract.string_dtype() for col in labels}})[
+        aggregates.cube_columns + aggregates.measure_columns]
@@ -0,0 +1,83 @@
+import os
+import shutil
+import pandas as pd
+from . import aggregates, sketch
+
+# Primary key column of each dimension mart, counted in the statistics file
+primary_keys = {
+    "Customer_Dimension": 'Customer ID',
+    "Product_Dimension": 'Product ID',
+    "Geography_Dimension": 'Geography ID',
+    "Time_Dimension": 'Date ID',
+    "Segment_Dimension": 'Segment ID',
+    "Product_Category_Dimension": 'Category ID',
+    "Region_Dimension": 'Region ID',
+}
+
+# Function to export a data mart given as an iterable of chunks to output_dir.
+# CSV: the chunks are written to the mart's CSV file and, when zipf is given, to its entry in the zip archive at the
+# same time, so the archive is built while writing instead of by reading the files back.
+# Parquet: each mart is written as a typed Parquet file with the chosen compression codec; Sales_Fact is written as a
+# dataset partitioned by order year and month so queries can read only the partitions and columns they need.
+def export_mart(name, chunks, output_dir, export_format, compression=None, zipf=None):
+    if export_format == 'parquet':
+        if name == "Sales_Fact":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            dataset_dir = os.path.join(output_dir, name)
+            shutil.rmtree(dataset_dir, ignore_errors=True)
+            for chunk in chunks:
+                # Rows without a valid order date go to the Order Year=0/Order Month=0 partition
+                chunk = chunk.assign(**{
+                    'Order Year': chunk['Order Date'].dt.year.fillna(0).astype('int16'),
+                    'Order Month': chunk['Order Date'].dt.month.fillna(0).astype('int8'),
+                })
+                # Written without the pandas metadata so readers infer the partition columns from the directory names
+                table = pa.Table.from_pandas(chunk, preserve_index=False).replace_schema_metadata(None)
+                pq.write_to_dataset(table, dataset_dir, partition_cols=['Order Year', 'Order Month'], compression=compression)
+        else:
+            pd.concat(chunks).to_parquet(os.path.join(output_dir, f"{name}.parquet"), compression=compression, index=False)
+        return
+
+    with open(os.path.join(output_dir, f"{name}.csv"), 'wb') as file:
+        entry = zipf.open(f"{name}.csv", 'w') if zipf is not None else None
+        try:
+            for i, chunk in enumerate(chunks):
+                data = chunk.to_csv(index=False, header=(i == 0)).encode()
+                file.write(data)
+                if entry is not None:
+                    entry.write(data)
+        finally:
+            if entry is not None:
+                entry.close()
+
+# Function to save the count of rows and distinct primary keys of every data mart to a CSV file.
+# Distinct keys are counted with sketches of the same kind as the Sales_Fact's, so they are exact or all HyperLogLog estimates.
+# The aggregate marts are listed after them with their grain, the columns they are grouped by, which is also their key.
+def write_stats(data_marts, fact_stats, path, aggregate_marts=None):
+    distinct = fact_stats['order_ids']['kind']
+    data_mart_stats = {
+        name: {
+            "rows": len(data_marts[name]),
+            "distinct_primary_keys": sketch.count_distinct(data_marts[name][key], distinct)
+        }
+        for name, key in primary_keys.items()
+    }
+    data_mart_stats["Sales_Fact"] = {
+        "rows": fact_stats['rows'],
+        "distinct_primary_keys": sketch.sketch_count(fact_stats['order_ids']),
+        "distinct_row_ids": sketch.sketch_count(fact_stats['order_date_ids'])
+    }
+    for name, aggregate in (aggregate_marts or {}).items():
+        data_mart_stats[name] = {
+            "rows": len(aggregate),
+            "distinct_primary_keys": len(aggregate),
+            "distinct_row_ids": None,
+            "grain": ", ".join(aggregates.aggregate_marts[name]),
+        }
+
+    stats_df = pd.DataFrame.from_dict(data_mart_stats, orient='index')
+    stats_df.reset_index(inplace=True)
+    stats_df.columns = ['Data Mart System Name', 'Count Rows', 'Count Distinct Primary Key', 'Count Distinct Row ID'] + (['Aggregate Grain'] if aggregate_marts else [])
+    stats_df.to_csv(path, index=False)
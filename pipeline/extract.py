@@ -0,0 +1,299 @@
+import os
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from . import cache
+
+# Version of the extraction logic. Bump it whenever read_file, align_columns or apply_schema change
+# so the cached chunks, and every stage output built from them, are rebuilt.
+version = "6"
+
+# Function to get the dtype of the ID and name columns: Arrow-backed strings with NaN for missing values
+# (the default str dtype of pandas 3), or plain object strings when pyarrow is not installed
+def string_dtype():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return object
+    try:
+        return pd.StringDtype('pyarrow', na_value=np.nan)
+    except TypeError:
+        return pd.StringDtype('pyarrow_numpy')
+
+# Default format of the Order Date and Ship Date values
+date_format = '%m/%d/%Y'
+
+# Formats tried when detecting the date format of a file's date columns. The default comes first so it wins ties,
+# e.g. when no day is above 12 and the sample parses as both month/day and day/month.
+candidate_date_formats = [date_format, '%Y-%m-%d', '%d/%m/%Y', '%m-%d-%Y', '%d-%m-%Y', '%d.%m.%Y', '%Y/%m/%d', '%m/%d/%y', '%Y%m%d']
+
+# Number of rows at the start of each file its date formats are detected from
+format_sample_rows = 10000
+
+# Declared schema of the pipe-delimited source files, applied to every chunk at extraction.
+# Low-cardinality text is categorical, IDs and names are Arrow-backed strings (postal codes keep their leading zeros),
+# Quantity and Discount are downcast, and values that do not fit their type become missing.
+schema = {
+    'Row ID': pd.Int32Dtype(),
+    'Order ID': string_dtype(),
+    'Order Date': 'datetime64[ns]',
+    'Ship Date': 'datetime64[ns]',
+    'Ship Mode': 'category',
+    'Customer ID': string_dtype(),
+    'Customer Name': string_dtype(),
+    'Segment': 'category',
+    'Country': 'category',
+    'City': 'category',
+    'State': 'category',
+    'Postal Code': string_dtype(),
+    'Region': 'category',
+    'Product ID': string_dtype(),
+    'Category': 'category',
+    'Sub-Category': 'category',
+    'Product Name': string_dtype(),
+    'Sales': 'float64',
+    'Quantity': pd.Int16Dtype(),
+    'Discount': 'float32',
+    'Profit': 'float64',
+}
+
+# Columns of the pipe-delimited source files
+source_columns = list(schema)
+
+# Columns holding dates
+date_columns = [col for col, dtype in schema.items() if dtype == 'datetime64[ns]']
+
+# Columns whose values become missing when they do not fit their type: the dates and the numbers.
+# The raw strings of such values are kept, so the rejected rows can be fixed from the quarantine.
+coercible_columns = [col for col, dtype in schema.items() if dtype == 'datetime64[ns]' or pd.api.types.is_numeric_dtype(dtype)]
+
+# Function to align a chunk to source_columns, adding columns missing from the file as empty string columns
+def align_columns(chunk):
+    for col in source_columns:
+        if col not in chunk.columns:
+            chunk[col] = pd.Series(index=chunk.index, dtype=object)
+    return chunk[source_columns]
+
+# Function to read the first format_sample_rows rows of a file as strings, to detect its date formats
+def read_sample(file_path):
+    return pd.read_csv(file_path, delimiter='|', dtype=str, nrows=format_sample_rows)
+
+# Function to detect the format of a column of date strings: the candidate format that parses the most distinct values
+def detect_date_format(values):
+    distinct = pd.Series(values.dropna().unique(), dtype=object)
+    best_format, best_count = date_format, 0
+    for candidate in candidate_date_formats:
+        count = pd.to_datetime(distinct, format=candidate, errors='coerce').notna().sum()
+        if count > best_count:
+            best_format, best_count = candidate, count
+    return best_format
+
+# Function to detect the format of each date column of a file from a sample of its rows.
+# Formats other than the default are reported, as values in any other format become NaT.
+def detect_date_formats(sample, file_path):
+    formats = {col: detect_date_format(sample[col]) for col in date_columns if col in sample.columns}
+    for col, col_format in formats.items():
+        if col_format != date_format:
+            print(f"Detected date format {col_format} for {col} in {file_path}")
+    return formats
+
+# Function to parse a column of date strings with a fixed format. Each distinct string is parsed once and the
+# results are mapped back to the rows, as a date column holds few distinct values. Dates outside the range of
+# datetime64[ns] become NaT like any other unparseable value.
+def parse_dates(values, col_format):
+    codes, distinct = pd.factorize(values)
+    parsed = pd.to_datetime(pd.Series(distinct, dtype=object), format=col_format, errors='coerce')
+    parsed = parsed.where(parsed.between(pd.Timestamp.min, pd.Timestamp.max)).astype('datetime64[ns]').to_numpy()
+    # Missing values have code -1, which picks the NaT appended at the end
+    return pd.Series(np.append(parsed, np.datetime64('NaT', 'ns'))[codes], index=values.index)
+
+# Function to apply the declared schema to a chunk read as strings, parsing the date columns with the file's
+# detected date_formats (the default format for columns without one).
+# The number of values of each column that did not fit its type and became missing is added to coerced, and their
+# raw strings, indexed by row, are appended to raw_values (column -> list of Series).
+def apply_schema(chunk, date_formats=None, coerced=None, raw_values=None):
+    raw = chunk
+    chunk = chunk.copy()
+    date_formats = date_formats or {}
+    for col, dtype in schema.items():
+        if dtype == 'datetime64[ns]':
+            chunk[col] = parse_dates(chunk[col], date_formats.get(col, date_format))
+        elif pd.api.types.is_numeric_dtype(dtype):
+            values = pd.to_numeric(chunk[col], errors='coerce')
+            if pd.api.types.is_integer_dtype(dtype):
+                limits = np.iinfo(dtype.numpy_dtype)
+                values = values.where((values % 1 == 0) & values.between(limits.min, limits.max))
+            chunk[col] = values.astype(dtype)
+        elif dtype == 'category':
+            # Categories are always strings, even for a column that is empty or missing from the file
+            chunk[col] = chunk[col].astype(string_dtype()).astype('category')
+        else:
+            chunk[col] = chunk[col].astype(dtype)
+        if col in coercible_columns and (coerced is not None or raw_values is not None):
+            lost = raw[col].notna() & chunk[col].isna()
+            count = int(lost.sum())
+            if count and coerced is not None:
+                coerced[col] = coerced.get(col, 0) + count
+            if count and raw_values is not None:
+                raw_values.setdefault(col, []).append(raw[col][lost])
+    return chunk
+
+# Function to sum the values of each column that did not fit its type over the extracted files
+def coerced_values(entries):
+    coerced = {}
+    for entry in entries:
+        for col, count in entry['coerced'].items():
+            coerced[col] = coerced.get(col, 0) + count
+    return coerced
+
+# Function to print a warning for the values of a file that did not fit their type and became missing
+def report_coerced(file_path, coerced):
+    for col, count in coerced.items():
+        print(f"Warning: {count} values of {col} in {file_path} do not fit its type ({schema[col]}) and became missing")
+
+# Function to concatenate chunks, unioning the categories of the categorical columns so they stay categorical
+def concat_chunks(chunks):
+    chunks = list(chunks)
+    for col in chunks[0].columns:
+        if isinstance(chunks[0][col].dtype, pd.CategoricalDtype):
+            categories = union_categoricals([chunk[col] for chunk in chunks]).categories
+            chunks = [chunk.assign(**{col: chunk[col].cat.set_categories(categories)}) for chunk in chunks]
+    return pd.concat(chunks)
+
+# Function to measure the memory use of each column of a chunk in bytes
+def column_memory(chunk):
+    return chunk.memory_usage(deep=True, index=False)
+
+# Function to print the memory use of each column before and after the schema was applied, summed over the parsed files
+def print_memory_report(memory):
+    report = pd.DataFrame(memory, columns=['before', 'after']).fillna(0) / 2**20
+    report.loc['Total'] = report.sum()
+    report['saved %'] = (1 - report['after'] / report['before']) * 100
+    print("Memory use by column (MB) before and after applying the schema:")
+    print(report.round(2).to_string())
+
+# Function to read a single source file as a stream of chunks of chunk_size rows.
+# Every column is read as a string so all chunks get the same dtypes whatever values they hold.
+# With chunk_size=None the whole file is returned as a single chunk.
+def read_file(file_path, chunk_size=None):
+    if chunk_size is None:
+        yield pd.read_csv(file_path, delimiter='|', dtype=str)
+    else:
+        with pd.read_csv(file_path, delimiter='|', dtype=str, chunksize=chunk_size) as reader:
+            for chunk in reader:
+                yield chunk
+
+# Function to parse a single source file into cached chunk files, run either in-process or in a pool worker.
+# The date formats are detected once per file and used for all of its chunks.
+# Returns the file's own columns, its date formats, the paths of its chunks, its row count, the number of values of
+# each column that did not fit its type, the path of their raw strings (None when there are none) and, with memory_report,
+# the memory use of each column before and after the schema was applied; or None if the file could not be read.
+def parse_file(file_path, chunk_size=None, memory_report=False):
+    try:
+        sample = read_sample(file_path)
+        columns = sample.columns.tolist()
+        date_formats = detect_date_formats(sample, file_path)
+        chunk_paths = []
+        rows = 0
+        coerced = {}
+        raw_values = {}
+        memory = pd.DataFrame(columns=['before', 'after'], dtype='int64')
+        for chunk in read_file(file_path, chunk_size):
+            typed = apply_schema(align_columns(chunk), date_formats, coerced, raw_values)
+            if memory_report:
+                chunk_memory = pd.DataFrame({'before': column_memory(chunk), 'after': column_memory(typed)})
+                memory = memory.add(chunk_memory, fill_value=0)
+            chunk_path = cache.cache_path('extract', file_path, f".chunk{len(chunk_paths)}.pkl")
+            typed.to_pickle(chunk_path)
+            chunk_paths.append(chunk_path)
+            rows += len(typed)
+        # The raw strings are indexed by row like the chunks, so the cleanse stage can look up those of its rejected rows
+        raw_path = None
+        if raw_values:
+            raw_path = cache.cache_path('extract', file_path, ".raw.pkl")
+            pd.DataFrame({col: pd.concat(values) for col, values in raw_values.items()}).to_pickle(raw_path)
+    except Exception as e:
+        print(f"Error reading {file_path}: {e}")
+        return None
+    print(f"Successfully read {file_path}")
+    report_coerced(file_path, coerced)
+    return {'columns': columns, 'date_formats': date_formats, 'chunks': chunk_paths, 'rows': rows, 'coerced': coerced, 'raw': raw_path, 'memory': memory if memory_report else None}
+
+# Function to list the CSV source files of a directory, sorted by name, followed by those of replay_dir, the directory
+# of the replayed quarantine rows (see cleanse.replay_quarantine), when it is given and exists. The file order decides
+# which of two duplicate rows is kept and the order new dimension members get their IDs, so it must not depend on the
+# file system.
+def source_files(data_dir, replay_dir=None):
+    file_paths = [os.path.join(data_dir, file_name) for file_name in sorted(os.listdir(data_dir)) if file_name.endswith(".csv")]
+    if replay_dir is not None and os.path.isdir(replay_dir):
+        file_paths += [os.path.join(replay_dir, file_name) for file_name in sorted(os.listdir(replay_dir)) if file_name.endswith(".csv")]
+    return file_paths
+
+# Extract stage: parse every CSV file in a directory, and in replay_dir when it is given, into cached chunks.
+# Files unchanged since the last run are taken from the cache; new and changed files are parsed, in a pool of
+# `workers` processes when workers > 1. With memory_report the memory use of each column of the parsed files is
+# printed before and after the schema was applied. Returns one entry per readable file, in file name order, with
+# the file name, the content key of its chunks (file content hash, extraction version and chunk size), its own
+# columns, its date formats, its row count, its chunk paths and the path of the raw strings of its values that did
+# not fit their type.
+def extract_files(data_dir, chunk_size=None, workers=1, full_refresh=False, memory_report=False, replay_dir=None):
+    file_version = f"{version}-{chunk_size}"
+    file_paths = source_files(data_dir, replay_dir)
+
+    manifest = cache.load_manifest(full_refresh)
+    entries = {}
+    changed_paths = []
+    for file_path in file_paths:
+        entry = cache.cached_entry(manifest, file_path, file_version)
+        if entry is None:
+            changed_paths.append(file_path)
+        else:
+            entries[file_path] = entry
+    print(f"Reusing {len(entries)} cached files, reading {len(changed_paths)} new or changed files")
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parsed = list(executor.map(parse_file, changed_paths, repeat(chunk_size), repeat(memory_report)))
+    else:
+        parsed = [parse_file(file_path, chunk_size, memory_report) for file_path in changed_paths]
+
+    for file_path, result in zip(changed_paths, parsed):
+        if result is None:
+            manifest.pop(file_path, None)
+            continue
+        outputs = {f"chunk{i}": chunk_path for i, chunk_path in enumerate(result['chunks'])}
+        if result['raw'] is not None:
+            outputs['raw'] = result['raw']
+        entries[file_path] = cache.record_outputs(manifest, file_path, file_version, outputs, columns=result['columns'], date_formats=result['date_formats'], rows=result['rows'], coerced=result['coerced'])
+
+    cache.prune_manifest(manifest, file_paths, [scanned_dir for scanned_dir in (data_dir, replay_dir) if scanned_dir is not None])
+    cache.save_manifest(manifest)
+
+    if memory_report:
+        memory = [result['memory'] for result in parsed if result is not None]
+        if memory:
+            print_memory_report(pd.concat(memory).groupby(level=0, sort=False).sum())
+        else:
+            print("No files were parsed, so there is no memory report (use --full-refresh to reparse every file)")
+
+    return [
+        {
+            'file': os.path.basename(file_path),
+            'key': f"{entries[file_path]['hash']}-{file_version}",
+            'columns': entries[file_path]['columns'],
+            'date_formats': entries[file_path]['date_formats'],
+            'rows': entries[file_path]['rows'],
+            'coerced': entries[file_path]['coerced'],
+            'chunks': [path for name, path in entries[file_path]['outputs'].items() if name.startswith('chunk')],
+            'raw': entries[file_path]['outputs'].get('raw'),
+        }
+        for file_path in file_paths if file_path in entries
+    ]
+
+# Function to load the extracted chunks of a file as one DataFrame with only the file's own columns
+def load_file(entry):
+    if not entry['chunks']:
+        return pd.DataFrame(columns=entry['columns'])
+    return concat_chunks(pd.read_pickle(chunk_path) for chunk_path in entry['chunks'])[entry['columns']]
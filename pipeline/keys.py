@@ -0,0 +1,82 @@
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+
+# Directory holding the surrogate keys of the dimensions. Unlike .etl_cache this is warehouse state:
+# deleting it renumbers every dimension on the next run.
+registry_dir = ".key_registry"
+
+# Function to load the key registry: dimension name -> Index of natural keys.
+# The surrogate key of a natural key is its position in the Index + 1; keys are only ever appended, so IDs never change.
+def load_registry():
+    registry = {}
+    if os.path.isdir(registry_dir):
+        for file_name in os.listdir(registry_dir):
+            if file_name.endswith(".pkl"):
+                registry[file_name[:-len(".pkl")]] = pd.read_pickle(os.path.join(registry_dir, file_name))
+    return registry
+
+# Function to save the key registry
+def save_registry(registry):
+    os.makedirs(registry_dir, exist_ok=True)
+    for name, keys in registry.items():
+        keys_path = os.path.join(registry_dir, f"{name}.pkl")
+        pd.to_pickle(keys, keys_path + ".tmp")
+        os.replace(keys_path + ".tmp", keys_path)
+
+# Function to fingerprint the contents of the key registry, so cached outputs that depend on the IDs are
+# rebuilt whenever a key is registered or the registry is deleted
+def registry_fingerprint(registry):
+    digest = hashlib.sha256()
+    for name in sorted(registry):
+        digest.update(name.encode())
+        digest.update(pd.util.hash_pandas_object(registry[name]).to_numpy().tobytes())
+    return digest.hexdigest()
+
+# Function to look up the surrogate keys of a column of natural keys.
+# Returns an array of IDs with 0 for natural keys that are not registered.
+def lookup_keys(registry, name, values):
+    keys = registry.get(name, pd.Index([]))
+    return keys.get_indexer(values) + 1
+
+# Function to get the surrogate keys of a column of natural keys, registering the ones not seen before.
+# New keys get the next free IDs in order of first appearance, so an empty registry numbers like pd.factorize + 1.
+def assign_keys(registry, name, values):
+    values = pd.Series(values)
+    # Register the values themselves rather than a categorical index whose categories differ from run to run
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype(values.cat.categories.dtype)
+    ids = lookup_keys(registry, name, values)
+    new_keys = pd.Index(values[ids == 0].unique())
+    if len(new_keys):
+        registry[name] = registry[name].append(new_keys) if name in registry else new_keys
+        ids = lookup_keys(registry, name, values)
+    return ids
+
+# Function to build the composite natural key of each row as a 64-bit hash of the key columns.
+# Vectorized over the whole frame; unlike joining the values into a string it cannot confuse
+# values that contain the separator, and missing values hash consistently.
+def composite_key(df, columns):
+    return pd.Series(pd.util.hash_pandas_object(df[columns], index=False).to_numpy(), index=df.index)
+
+# Function to prebuild the lookup index of a dimension from its natural key columns to its ID column.
+# Rows sharing a natural key share an ID, so each key is indexed once.
+def build_key_index(dim, columns, id_column):
+    keys = composite_key(dim, columns)
+    first = ~keys.duplicated().to_numpy()
+    return {
+        'columns': columns,
+        'keys': pd.Index(keys.to_numpy()[first]),
+        'ids': dim[id_column].to_numpy()[first],
+    }
+
+# Function to look up the dimension IDs of fact rows on the full natural key.
+# Returns exactly one ID per input row, 0 where the key has no match in the dimension, and reports the misses.
+def join_keys(key_index, df, name):
+    positions = key_index['keys'].get_indexer(composite_key(df, key_index['columns']))
+    ids = np.where(positions >= 0, key_index['ids'][positions], 0)
+    misses = int((positions < 0).sum())
+    if misses:
+        print(f"Warning: {misses} rows have no match in the {name} dimension")
+    return ids
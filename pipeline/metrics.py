@@ -0,0 +1,135 @@
+import os
+import sys
+import json
+import time
+import uuid
+import datetime
+import contextlib
+
+# Settings of the current run, set by configure(). Metrics are off while path is None.
+settings = {'path': None, 'script': None, 'run_id': None}
+
+# Running peak RSS of the stages that are open, innermost last
+open_stages = []
+
+# Default file the metrics are appended to
+default_metrics_path = "ETL_Metrics.jsonl"
+
+# Function to add the metrics and profiling options to a script's argument parser
+def add_arguments(parser):
+    parser.add_argument('--metrics-file', default=default_metrics_path,
+                        help=f"Append one JSON line of metrics per stage to this file (default: {default_metrics_path})")
+    parser.add_argument('--no-metrics', action='store_true',
+                        help="Do not record any metrics")
+    parser.add_argument('--profile-output', default=None,
+                        help="Profile the run and dump it to this file: cProfile statistics, or a pyinstrument HTML report for a .html path")
+
+# Function to switch metrics on for a run from the parsed arguments, or off with --no-metrics
+def configure(script, args):
+    settings.update(path=None if args.no_metrics else args.metrics_file, script=script, run_id=uuid.uuid4().hex[:12])
+
+# Function to get the CPU time of the process and its finished worker processes in seconds
+def cpu_seconds():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+# Function to reset the peak RSS of the process, so the next reading is the peak of the stage that starts now.
+# Only Linux supports this; elsewhere the peak is the high-water mark of the whole process so far.
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+    except OSError:
+        pass
+
+# Function to get the peak RSS of the process in MB, or None where it cannot be measured
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 2**10
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+# Function to append a record to the metrics file as one JSON line
+def write_record(record):
+    with open(settings['path'], 'a') as file:
+        file.write(json.dumps(record, default=str) + '\n')
+
+# Context manager timing a stage. It yields a dict the stage fills with its own metrics (rows_in, rows_out,
+# dropped, cached, ...); on exit the wall time, CPU time and peak RSS are added and the record is written.
+# Stages can be nested: the peak RSS of an outer stage includes the peaks of the stages inside it.
+# When metrics are off the dict is simply discarded.
+@contextlib.contextmanager
+def stage(name):
+    record = {}
+    if settings['path'] is None:
+        yield record
+        return
+
+    if open_stages:
+        open_stages[-1] = max(open_stages[-1], peak_rss_mb() or 0)
+    reset_peak_rss()
+    open_stages.append(0)
+    started_at = datetime.datetime.now().isoformat(timespec='seconds')
+    start_wall = time.perf_counter()
+    start_cpu = cpu_seconds()
+    status = 'failed'
+    try:
+        yield record
+        status = 'ok'
+    finally:
+        peak = max(open_stages.pop(), peak_rss_mb() or 0)
+        if open_stages:
+            open_stages[-1] = max(open_stages[-1], peak)
+        write_record({
+            'run_id': settings['run_id'],
+            'script': settings['script'],
+            'stage': name,
+            'status': status,
+            'started_at': started_at,
+            'wall_seconds': round(time.perf_counter() - start_wall, 3),
+            'cpu_seconds': round(cpu_seconds() - start_cpu, 3),
+            'peak_rss_mb': round(peak, 1) if peak else None,
+            **record,
+        })
+
+# Context manager profiling everything inside it and dumping the profile to path: an HTML report with pyinstrument
+# for a .html path, otherwise cProfile statistics (readable with pstats or snakeviz). Does nothing when path is None.
+@contextlib.contextmanager
+def profiler(path):
+    if path is None:
+        yield
+        return
+
+    if path.endswith('.html'):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise ImportError("Writing an HTML profile requires pyinstrument; use a .prof path for cProfile instead")
+        profile = Profiler()
+        profile.start()
+        try:
+            yield
+        finally:
+            profile.stop()
+            with open(path, 'w') as file:
+                file.write(profile.output_html())
+    else:
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(path)
+    print(f"{path} has been created successfully.")
@@ -0,0 +1,157 @@
+import time
+import numpy as np
+import pandas as pd
+from . import cache, cleanse, extract, keys, sketch
+
+# Version of the modelling logic. Bump it whenever the dimensions or the fact keying change so cached dimensions are rebuilt.
+version = "2"
+
+# Columns kept for each dimension, accumulated as distinct rows while the cleansed data is streamed
+dimension_columns = {
+    'customer': ['Customer ID', 'Customer Name', 'Segment'],
+    'product': ['Product ID', 'Product Name', 'Sub-Category', 'Category'],
+    'geography': ['Country', 'State', 'City', 'Postal Code', 'Region'],
+}
+
+# Date columns whose range the calendar Time dimension covers
+date_columns = ['Order Date', 'Ship Date']
+
+# Month the fiscal year starts in; a fiscal year is named after the calendar year it ends in
+fiscal_year_start_month = 7
+
+# Natural key columns of the Geography dimension, whose IDs are looked up for the fact table
+geography_key = ['Country', 'State', 'Postal Code']
+
+# Columns kept for the fact table; Ship Mode is kept as a degenerate dimension
+fact_columns = ['Order ID', 'Product ID', 'Customer ID', 'Order Date', 'Ship Date', 'Ship Mode', 'Sales', 'Quantity', 'Discount', 'Profit', 'Postal Code']
+
+# Function to add the distinct dimension rows of a cleaned chunk to the running dimensions.
+# The calendar only needs the first and last date of the data, kept as dimensions['date_range'].
+def update_dimensions(dimensions, df):
+    for name, columns in dimension_columns.items():
+        rows = df[columns].drop_duplicates()
+        if name in dimensions:
+            rows = extract.concat_chunks([dimensions[name], rows]).drop_duplicates()
+        dimensions[name] = rows
+    dates = df[date_columns]
+    dimensions['date_range'] = pd.concat([dimensions.get('date_range'), dates.min(), dates.max()]).agg(['min', 'max'])
+
+# Function to compute the yyyymmdd integer key of each date from its year, month and day.
+# No strings are built and no lookup is needed, so the same date always gets the same key. Missing dates get key 0.
+def date_key(dates):
+    return (dates.dt.year * 10000 + dates.dt.month * 100 + dates.dt.day).fillna(0).astype(np.int32)
+
+# Function to build the calendar Time dimension: one row per day from first to last, keyed by yyyymmdd,
+# with its calendar attributes, ISO week and weekday (1 = Monday) and fiscal year and period
+def calendar_dimension(first, last):
+    if pd.isna(first):
+        dates = pd.Series([], dtype='datetime64[ns]')
+    else:
+        dates = pd.Series(pd.date_range(first, last, freq='D')).astype('datetime64[ns]')
+    month = dates.dt.month
+    starts_fiscal_year = (month >= fiscal_year_start_month) & (fiscal_year_start_month > 1)
+    return pd.DataFrame({
+        'Date ID': date_key(dates),
+        'Calendar Date': dates,
+        'Year': dates.dt.year.astype('int16'),
+        'Quarter': dates.dt.quarter.astype('int8'),
+        'Month': month.astype('int8'),
+        'Week': dates.dt.isocalendar()['week'].astype('int8'),
+        'Weekday': (dates.dt.dayofweek + 1).astype('int8'),
+        'Fiscal Year': (dates.dt.year + starts_fiscal_year).astype('int16'),
+        'Fiscal Period': ((month - fiscal_year_start_month) % 12 + 1).astype('int8'),
+    })
+
+# Function to build the dimension tables from the accumulated distinct rows and date range.
+# IDs come from the persistent key registry, so a natural key keeps the same ID from one run to the next;
+# the Time dimension is a calendar keyed by yyyymmdd and needs no registry.
+def build_dimensions(dimensions, registry):
+    customer_dim = dimensions['customer'].copy()
+    customer_dim['Segment ID'] = keys.assign_keys(registry, 'Segment', customer_dim['Segment'])
+
+    product_dim = dimensions['product'].copy()
+    product_dim['Sub-Category ID'] = keys.assign_keys(registry, 'Sub-Category', product_dim['Sub-Category'])
+
+    geography_dim = dimensions['geography'].copy()
+    geography_dim['Geography ID'] = keys.assign_keys(registry, 'Geography', keys.composite_key(geography_dim, geography_key))
+    geography_dim['Region ID'] = keys.assign_keys(registry, 'Region', geography_dim['Region'])
+
+    time_dim = calendar_dimension(dimensions['date_range']['min'], dimensions['date_range']['max'])
+
+    segment_dim = customer_dim[['Segment ID', 'Segment']].drop_duplicates().copy()
+    segment_dim.columns = ['Segment ID', 'Segment Name']
+
+    product_category_dim = product_dim[['Sub-Category ID', 'Category']].drop_duplicates().copy()
+    product_category_dim['Category ID'] = keys.assign_keys(registry, 'Category', product_category_dim['Category'])
+    product_category_dim['Category Name'] = product_category_dim['Category']
+
+    region_dim = geography_dim[['Region', 'Region ID']].drop_duplicates().copy()
+    region_dim.columns = ['Region Name', 'Region ID']
+
+    return {
+        "Customer_Dimension": customer_dim,
+        "Product_Dimension": product_dim,
+        "Geography_Dimension": geography_dim,
+        "Time_Dimension": time_dim,
+        "Segment_Dimension": segment_dim,
+        "Product_Category_Dimension": product_category_dim,
+        "Region_Dimension": region_dim,
+    }
+
+# Model stage: build the dimension tables from the cleansed data and register their keys.
+# The dimensions are cached under the cleansed data's key, the modelling version and the state of the key registry,
+# so they are only rebuilt when the data, the logic or the IDs change.
+def model_dimensions(cleansed):
+    registry = keys.load_registry()
+    key = cache.stage_key('model', version, [cleansed['key'], keys.registry_fingerprint(registry)])
+    data_marts = cache.load_stage('model', key)
+    if data_marts is not None:
+        print("Reusing the cached dimensions")
+        return data_marts
+
+    dimensions = {}
+    for cleaned_data in cleanse.cleansed_chunks(cleansed):
+        update_dimensions(dimensions, cleaned_data)
+    data_marts = build_dimensions(dimensions, registry)
+    keys.save_registry(registry)
+
+    # Cache the dimensions under the registry state they leave behind, which is what the next run will look up
+    key = cache.stage_key('model', version, [cleansed['key'], keys.registry_fingerprint(registry)])
+    cache.save_stage('model', key, data_marts)
+    cache.prune_stage('model', keep_keys={key}, keep_recent=cleanse.keep_recent)
+    return data_marts
+
+# Function to create the statistics collected while the Sales_Fact is keyed: its row count and distinct-count
+# sketches of its Order IDs and Order Date IDs, exact or HyperLogLog (distinct='hll') for huge key spaces
+def new_fact_stats(distinct='exact'):
+    return {'rows': 0, 'order_ids': sketch.new_sketch(distinct), 'order_date_ids': sketch.new_sketch(distinct)}
+
+# Function to add a keyed Sales_Fact chunk to the statistics
+def update_fact_stats(fact_stats, sales_fact):
+    fact_stats['rows'] += len(sales_fact)
+    sketch.update_sketch(fact_stats['order_ids'], sales_fact['Order ID'])
+    sketch.update_sketch(fact_stats['order_date_ids'], sales_fact['Order Date ID'])
+
+# Function to build a Sales_Fact chunk from cleaned rows and their Geography IDs.
+# The order and ship date keys are computed from the dates themselves, so they need no join.
+def sales_fact_chunk(cleaned_data, geography_ids):
+    sales_fact = cleaned_data[fact_columns].copy()
+    sales_fact['Order Date ID'] = date_key(cleaned_data['Order Date'])
+    sales_fact['Ship Date ID'] = date_key(cleaned_data['Ship Date'])
+    sales_fact['Geography ID'] = geography_ids
+    return sales_fact
+
+# Function to key the cleansed chunks against the finished dimensions, yielding one Sales_Fact chunk per cleansed chunk.
+# Geography IDs are looked up on the dimension's full natural key, so every fact row gets exactly one row in the output.
+# The statistics needed for the statistics file are collected in fact_stats (see new_fact_stats),
+# together with the time spent keying the rows.
+def key_sales_fact(cleansed, geography_dim, fact_stats):
+    geography_index = keys.build_key_index(geography_dim, geography_key, 'Geography ID')
+
+    for cleaned_data in cleanse.cleansed_chunks(cleansed):
+        start = time.perf_counter()
+        sales_fact = sales_fact_chunk(cleaned_data, keys.join_keys(geography_index, cleaned_data, "Geography"))
+        fact_stats['join_seconds'] = fact_stats.get('join_seconds', 0) + time.perf_counter() - start
+
+        update_fact_stats(fact_stats, sales_fact)
+        yield sales_fact
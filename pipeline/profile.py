@@ -0,0 +1,226 @@
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from . import cache, extract
+
+# Version of the profiling logic. Bump it whenever profile_data or the quality rules change so cached profiles are rebuilt.
+version = "3"
+
+# Columns every source file is expected to have
+required_columns = [
+    'Order ID', 'Order Date', 'Ship Date', 'Customer ID', 'Customer Name',
+    'Sales', 'Quantity', 'Discount', 'Profit', 'Postal Code', 'Country'
+]
+
+# Registry of row-level data-quality rules, evaluated in registration order.
+# Each rule gets one bit in the per-row flag mask built by profile_data.
+quality_rules = []
+
+# Decorator to register a vectorized predicate as a data-quality rule.
+# The predicate receives the file's DataFrame and returns a boolean Series marking the inconsistent rows
+# (missing values count as not flagged); it only runs when all of the rule's columns are present.
+def register_rule(name, columns, description, suggestion):
+    def decorator(predicate):
+        quality_rules.append({
+            'name': name,
+            'columns': columns,
+            'predicate': predicate,
+            'description': description,
+            'suggestion': suggestion,
+        })
+        return predicate
+    return decorator
+
+@register_rule("Invalid Data Formats", ['Order Date'],
+               "Invalid order date formats found",
+               "Handle programmatically: Correct or remove records with unparseable order dates")
+def invalid_order_dates(df):
+    # Order Date was parsed with the file's detected format at extraction; values that did not parse are NaT
+    return df['Order Date'].isna()
+
+@register_rule("Zero Sales and Quantity", ['Sales', 'Quantity'],
+               "Zero sales and zero quantity found",
+               "Handle programmatically: Correct or remove records with zero sales and zero quantity")
+def zero_sales_and_quantity(df):
+    return (df['Sales'] == 0) & (df['Quantity'] == 0)
+
+@register_rule("Negative Sales Values", ['Sales'],
+               "Negative sales values found",
+               "Handle programmatically: Remove or correct negative sales values")
+def negative_sales(df):
+    return df['Sales'] < 0
+
+@register_rule("Unrealistic Discount Values", ['Discount'],
+               "Unrealistic discount values found",
+               "Handle programmatically: Ensure discount values are between 0 and 1")
+def unrealistic_discounts(df):
+    return (df['Discount'] < 0) | (df['Discount'] > 1)
+
+# Assuming US postal codes here for simplicity
+@register_rule("Invalid Postal Codes", ['Postal Code'],
+               "Invalid postal codes found",
+               "Handle programmatically: Ensure postal codes follow the correct format")
+def invalid_postal_codes(df):
+    return ~df['Postal Code'].astype(str).str.match(r'^\d{5}(-\d{4})?$')
+
+@register_rule("Inconsistent Country Names", ['Country'],
+               "Inconsistent country names found",
+               "Handle programmatically: Ensure country names match the predefined list")
+def inconsistent_countries(df):
+    valid_countries = ['United States']
+    return ~df['Country'].isin(valid_countries)
+
+@register_rule("Mismatched Order and Ship Dates", ['Order Date', 'Ship Date'],
+               "Mismatched order and ship dates found",
+               "Investigate Further: Ensure ship dates are not before order dates")
+def mismatched_dates(df):
+    return df['Ship Date'] < df['Order Date']
+
+# The same customer name should always have the same customer ID. The rule only sees one file;
+# check_customers_across_files extends it to customers whose ID differs between files.
+@register_rule("Inconsistent Customer IDs", ['Customer ID', 'Customer Name'],
+               "Inconsistent customer IDs found",
+               "Handle programmatically: Ensure customer IDs are consistent for the same customer name")
+def inconsistent_customer_ids(df):
+    return df.groupby('Customer Name')['Customer ID'].transform('nunique') > 1
+
+@register_rule("Negative Profit Values", ['Profit'],
+               "Negative profit values found",
+               "Requires Business input : Investigate reasons for negative profit")
+def negative_profits(df):
+    return df['Profit'] < 0
+
+# Function to profile data for inconsistencies.
+# All registered rules are evaluated into one flag mask with a bit per rule; only the flagged rows are kept,
+# as their row IDs and flags, so the result stays compact however many rows or rules there are.
+def profile_data(df):
+    # Check for missing columns
+    missing_columns = [col for col in required_columns if col not in df.columns]
+
+    flags = np.zeros(len(df), dtype=np.min_scalar_type((1 << len(quality_rules)) - 1))
+    for bit, rule in enumerate(quality_rules):
+        if all(col in df.columns for col in rule['columns']):
+            flags |= rule['predicate'](df).fillna(False).to_numpy(dtype=bool).astype(flags.dtype) << bit
+
+    flagged = np.flatnonzero(flags)
+    return {
+        'missing_columns': missing_columns,
+        'row_ids': df.index.to_numpy()[flagged],
+        'flags': flags[flagged],
+    }
+
+# Function to get the bit of a rule in the flag mask
+def rule_bit(name):
+    return next(bit for bit, rule in enumerate(quality_rules) if rule['name'] == name)
+
+# Function to flag the rows of a mask with a rule's bit, returning the updated profile of the file's DataFrame
+def add_rule_flags(profile, df, bit, mask):
+    flags = np.zeros(len(df), dtype=profile['flags'].dtype)
+    flags[df.index.get_indexer(profile['row_ids'])] = profile['flags']
+    flags |= mask.to_numpy(dtype=bool).astype(flags.dtype) << bit
+    flagged = np.flatnonzero(flags)
+    return {**profile, 'row_ids': df.index.to_numpy()[flagged], 'flags': flags[flagged]}
+
+# Function to get the row IDs flagged by a rule from a profile
+def rule_row_ids(profile, bit):
+    return profile['row_ids'][(profile['flags'] >> bit) & 1 == 1]
+
+# Function to list the inconsistencies found in a profile as (type, flagged row IDs) pairs
+def profile_inconsistencies(profile):
+    for bit, rule in enumerate(quality_rules):
+        row_ids = rule_row_ids(profile, bit)
+        if len(row_ids):
+            yield rule, row_ids
+
+# Function to convert example rows to lists of report cell values in the file's column order.
+# Missing values (NaN, NaT, NA) become empty cells and float32 values keep their short decimal form (0.2, not 0.2000000029).
+def example_rows(rows):
+    rows = rows.copy()
+    for col in rows.columns:
+        if rows[col].dtype == 'float32':
+            rows[col] = rows[col].astype(str).astype('float64')
+    return [[None if pd.isna(value) else value for value in row] for row in rows.astype(object).itertuples(index=False)]
+
+# Function to get the mergeable customer state of a file: its distinct Customer Name / Customer ID pairs,
+# or None when the file lacks one of the columns. Missing names and IDs are left out, as the rule ignores them.
+def customer_id_pairs(df):
+    if 'Customer Name' not in df.columns or 'Customer ID' not in df.columns:
+        return None
+    return df[['Customer Name', 'Customer ID']].dropna().drop_duplicates().reset_index(drop=True)
+
+# Function to merge the customer states of files into the names that have more than one Customer ID across them
+def inconsistent_customer_names(states):
+    states = [state for state in states if state is not None]
+    if not states:
+        return set()
+    pairs = pd.concat(states).drop_duplicates()
+    id_counts = pairs.groupby('Customer Name', sort=False).size()
+    return set(id_counts.index[id_counts > 1])
+
+# Function to profile a single extracted file, run either in-process or in a pool worker.
+# Only the compact results the report needs are returned: the profile, row count, example rows and the customer state
+# merged across files.
+def profile_file(entry):
+    df = extract.load_file(entry)
+
+    profile = profile_data(df)
+    examples = {}
+    if profile['missing_columns']:
+        examples["Missing Columns"] = example_rows(df.head(2))
+    for rule, row_ids in profile_inconsistencies(profile):
+        examples[rule['name']] = example_rows(df.loc[row_ids[:2]])
+
+    return {
+        'file': entry['file'],
+        'profile': profile,
+        'examples': examples,
+        'row_count': df.shape[0],
+        'head_index': df.head(2).index.tolist(),
+        'customer_ids': customer_id_pairs(df),
+    }
+
+# Function to flag the customers whose ID differs between files, which the per-file rule cannot see.
+# The customer states of all files are merged into the names with more than one ID; only the files holding such a
+# name that was consistent within the file are loaded again, to flag its rows. Returns the updated results.
+def check_customers_across_files(results, entries):
+    names = inconsistent_customer_names(result['customer_ids'] for result in results)
+    bit = rule_bit("Inconsistent Customer IDs")
+    checked = []
+    for entry, result in zip(entries, results):
+        pairs = result['customer_ids']
+        if pairs is None or not names:
+            checked.append(result)
+            continue
+        id_counts = pairs.groupby('Customer Name', sort=False).size()
+        new_names = set(id_counts.index[id_counts == 1]) & names
+        if not new_names:
+            checked.append(result)
+            continue
+
+        df = extract.load_file(entry)
+        profile = add_rule_flags(result['profile'], df, bit, df['Customer Name'].isin(new_names))
+        examples = {**result['examples'], "Inconsistent Customer IDs": example_rows(df.loc[rule_row_ids(profile, bit)[:2]])}
+        checked.append({**result, 'profile': profile, 'examples': examples})
+    return checked
+
+# Profile stage: profile every extracted file, in a pool of `workers` processes when workers > 1.
+# Each file's result is cached under the content key of its chunks, so unchanged files are not profiled again;
+# the checks across files are then run on the merged per-file states.
+# Returns the results in file order so the report matches a serial run.
+def profile_files(entries, workers=1):
+    keys = [cache.stage_key('profile', version, [entry['key'], entry['file']]) for entry in entries]
+    results = [cache.load_stage('profile', key) for key in keys]
+    todo = [i for i, result in enumerate(results) if result is None]
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            profiled = list(executor.map(profile_file, [entries[i] for i in todo]))
+    else:
+        profiled = [profile_file(entries[i]) for i in todo]
+
+    for i, result in zip(todo, profiled):
+        cache.save_stage('profile', keys[i], result)
+        results[i] = result
+
+    cache.prune_stage('profile', keep_keys=set(keys))
+    return check_customers_across_files(results, entries)
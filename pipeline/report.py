@@ -0,0 +1,124 @@
+import pandas as pd
+from openpyxl import Workbook
+from .profile import profile_inconsistencies
+
+# Maximum number of rows in an Excel worksheet, header included
+excel_max_rows = 1048576
+
+# Header of the Quality_Report sheets and sidecar file
+quality_report_columns = ["Inconsistency Type", "File Name", "Row ID", "Description"]
+
+# Function to list the inconsistencies of a profiled file for the report.
+# Yields the type, description, suggestion, the number of affected rows and the row IDs listed in the quality report.
+def report_inconsistencies(result):
+    missing_columns = result['profile']['missing_columns']
+    if missing_columns:
+        description = f"Inconsistency found in columns: {', '.join(missing_columns)}"
+        suggestion = "Requires SME input: Standardize data types across columns"
+        yield "Missing Columns", description, suggestion, result['row_count'], result['head_index']
+
+    for rule, row_ids in profile_inconsistencies(result['profile']):
+        yield rule['name'], rule['description'], rule['suggestion'], len(row_ids), row_ids.tolist()
+
+# Function to create the Quality_Report sheet in a write-only workbook.
+# Returns an append function that continues on a new sheet (Quality_Report_2, Quality_Report_3, ...)
+# whenever the current one reaches Excel's row limit.
+def quality_report_appender(wb):
+    sheets = []
+    state = {'rows': 0}
+
+    def new_sheet():
+        title = "Quality_Report" if not sheets else f"Quality_Report_{len(sheets) + 1}"
+        sheets.append(wb.create_sheet(title=title))
+        sheets[-1].append(quality_report_columns)
+        state['rows'] = 1
+
+    def append(row):
+        if state['rows'] >= excel_max_rows:
+            new_sheet()
+        sheets[-1].append(row)
+        state['rows'] += 1
+
+    new_sheet()
+    return append
+
+# Function to build the quality report rows as one DataFrame per file and inconsistency type
+def quality_report_frames(results, summary_dict):
+    for result in results:
+        for inc_type, description, suggestion, row_count, row_ids in report_inconsistencies(result):
+            yield pd.DataFrame({
+                "Inconsistency Type": inc_type,
+                "File Name": result['file'],
+                "Row ID": pd.Series(row_ids, dtype='int64'),
+                "Description": summary_dict[inc_type]["Description"],
+            }, columns=quality_report_columns)
+
+# Function to write the full quality report to a Parquet or CSV sidecar file, one batch at a time
+def write_quality_sidecar(results, summary_dict, path):
+    frames = quality_report_frames(results, summary_dict)
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Writing the quality report to Parquet requires pyarrow; use a .csv sidecar instead")
+        schema = pa.schema([(col, pa.int64() if col == "Row ID" else pa.string()) for col in quality_report_columns])
+        with pq.ParquetWriter(path, schema) as writer:
+            for frame in frames:
+                writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+    else:
+        pd.DataFrame(columns=quality_report_columns).to_csv(path, index=False)
+        for frame in frames:
+            frame.to_csv(path, mode='a', header=False, index=False)
+
+# Function to generate the Inconsistency Report in Excel from the compact per-file results.
+# The workbook is written in write-only mode so rows are streamed to disk instead of held in memory.
+# With a sidecar path the quality report rows go to that file and the workbook keeps only the summary and examples.
+def write_report(results, path, sidecar_path=None):
+    # Create a new write-only Excel workbook
+    wb = Workbook(write_only=True)
+
+    # Inconsistencies Summary Sheet
+    ws_summary = wb.create_sheet(title="Inconsistencies_Summary")
+    ws_summary.append(["Inconsistency Type", "Description", "Suggestion to handle", "Distinct Count of Row ID"])
+
+    # Examples of Inconsistencies Sheet
+    ws_examples = wb.create_sheet(title="Inconsistencies_Examples")
+    ws_examples.append(["Inconsistency Type", "Row ID", "Order ID", "Order Date", "Ship Date", "Ship Mode", "Customer ID", "Customer Name", "Segment", "Country", "City", "State", "Postal Code", "Region", "Product ID", "Category", "Sub-Category", "Product Name", "Sales", "Quantity", "Discount", "Profit"])
+
+    # Data Quality Report Sheets
+    if sidecar_path is None:
+        append_quality = quality_report_appender(wb)
+
+    # Generate Inconsistency Report
+    summary_dict = {}
+    for result in results:
+        for inc_type, description, suggestion, row_count, row_ids in report_inconsistencies(result):
+            if inc_type not in summary_dict:
+                summary_dict[inc_type] = {"Description": "", "Suggestion to handle": "", "Distinct Count of Row ID": 0}
+            summary_dict[inc_type]["Description"] = description
+            summary_dict[inc_type]["Suggestion to handle"] = suggestion
+            summary_dict[inc_type]["Distinct Count of Row ID"] += row_count
+
+            # Add examples of the inconsistency
+            for row in result['examples'][inc_type]:
+                ws_examples.append([inc_type] + row)
+
+    # Populate Inconsistencies_Summary sheet
+    for inc_type, details in summary_dict.items():
+        if details["Distinct Count of Row ID"] == 0:
+            continue  # Skip inconsistencies with zero count
+        ws_summary.append([inc_type, details["Description"], details["Suggestion to handle"], details["Distinct Count of Row ID"]])
+
+    # Generate Data Quality Report
+    if sidecar_path is None:
+        for result in results:
+            for inc_type, description, suggestion, row_count, row_ids in report_inconsistencies(result):
+                description = summary_dict[inc_type]["Description"]
+                for row_id in row_ids:
+                    append_quality([inc_type, result['file'], row_id, description])
+    else:
+        write_quality_sidecar(results, summary_dict, sidecar_path)
+
+    # Save workbook
+    wb.save(path)
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+# Distinct-count sketches over the 64-bit hashes of the values (pd.util.hash_array), so the distinct keys of a
+# column can be counted chunk by chunk without holding the values themselves.
+# - exact: the sorted distinct hashes, 8 bytes per distinct value; exact up to 64-bit hash collisions.
+# - hll: a HyperLogLog of 2**precision one-byte registers (16 KB by default), whatever the number of values,
+#   with a typical relative error of 1.04 / sqrt(2**precision), about 0.8% by default.
+sketch_kinds = ['exact', 'hll']
+
+# Default number of index bits of a HyperLogLog sketch
+default_precision = 14
+
+# Function to create an empty sketch of the given kind
+def new_sketch(kind='exact', precision=default_precision):
+    if kind == 'exact':
+        return {'kind': kind, 'hashes': np.empty(0, dtype=np.uint64), 'pending': []}
+    if kind == 'hll':
+        return {'kind': kind, 'precision': precision, 'registers': np.zeros(1 << precision, dtype=np.uint8)}
+    raise ValueError(f"Unknown sketch kind {kind!r}; choose from: {', '.join(sketch_kinds)}")
+
+# Function to hash the distinct values of a column as the sketches do; missing values hash to one value, so they count once.
+# Only the distinct values are hashed, which is much cheaper than hashing every string of the column.
+def hash_values(values):
+    distinct = pd.Series(values).drop_duplicates()
+    return pd.util.hash_array(distinct.to_numpy(), categorize=False)
+
+# Function to get the number of significant bits of each value of a uint64 array
+def bit_length(values):
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    with np.errstate(divide='ignore'):
+        return np.where(high > 0, 33 + np.floor(np.log2(high)), np.where(low > 0, 1 + np.floor(np.log2(low)), 0)).astype(np.uint8)
+
+# Function to add a column of values to a sketch
+def update_sketch(sketch, values):
+    hashes = hash_values(values)
+    if sketch['kind'] == 'exact':
+        # New hashes are compacted into the sorted distinct hashes once they outnumber them, so updates stay
+        # cheap however many chunks are added
+        sketch['pending'].append(np.sort(hashes))
+        if sum(len(pending) for pending in sketch['pending']) >= len(sketch['hashes']):
+            compact(sketch)
+    else:
+        precision = sketch['precision']
+        width = 64 - precision
+        index = (hashes >> np.uint64(width)).astype(np.intp)
+        # Rank of a hash: position of the first 1 bit after the index bits, width + 1 when they are all 0
+        rank = (width + 1 - bit_length(hashes & np.uint64((1 << width) - 1))).astype(np.uint8)
+        np.maximum.at(sketch['registers'], index, rank)
+    return sketch
+
+# Function to fold the pending hashes of an exact sketch into its sorted distinct hashes.
+# Sorting and dropping repeats is much faster than np.unique on large uint64 arrays.
+def compact(sketch):
+    if sketch['pending']:
+        hashes = np.sort(np.concatenate([sketch['hashes']] + sketch['pending']))
+        sketch['hashes'] = hashes[np.concatenate(([True], hashes[1:] != hashes[:-1]))[:len(hashes)]]
+        sketch['pending'] = []
+
+# Function to get the number of distinct values added to a sketch (an estimate for HyperLogLog)
+def sketch_count(sketch):
+    if sketch['kind'] == 'exact':
+        compact(sketch)
+        return len(sketch['hashes'])
+    registers = sketch['registers']
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    # Small cardinalities are estimated from the share of empty registers (linear counting)
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * np.log(m / zeros)
+    return int(round(estimate))
+
+# Function to count the distinct values of a column with a sketch of the given kind
+def count_distinct(values, kind='exact'):
+    return sketch_count(update_sketch(new_sketch(kind), values))